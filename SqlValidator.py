@@ -1,18 +1,25 @@
 import streamlit as st
-import requests
-import pandas as pd
 import json
-import yaml
 import time
 import os
 from datetime import datetime
 
+# pandas, requests and yaml are imported inside the code paths that need them,
+# since Streamlit re-runs this script on every interaction
+from snapshot_store import snapshots_available, load_snapshot, save_snapshot
+from revalidation import revalidate_all, find_regressions, last_successful, update_performance, bind_sample_parameters
+from query_guard import check_query, expected_runtime, record_runtime, fetch_query_plan
+from session_manager import get_session, cache_partition
+
 # Configuration for the app
 st.set_page_config(page_title="Denodo SQL Query Validator", layout="wide")
 
 # Constants
 YAML_FILE_PATH = "verified_queries.yaml"
 API_ENDPOINT = "http://localhost:8008/answerDataQuestion"  # Adjust this to your Denodo AI SDK endpoint
+AI_SDK_TIMEOUT_SECONDS = 300  # Deadline for AI SDK answers, after which the request is aborted
+REVALIDATION_POOL_SIZE = 4  # Default number of verified queries executed concurrently when re-validating
+REVALIDATION_MAX_POOL_SIZE = 16  # Connections pooled per Denodo session (POOL_MAXSIZE in background_request.py)
 
 # CSS styling
 st.markdown("""
@@ -64,8 +71,18 @@ if 'edited_sql' not in st.session_state:
     st.session_state.edited_sql = ""
 if 'query_name' not in st.session_state:
     st.session_state.query_name = ""
+if 'denodo_username' not in st.session_state:
+    st.session_state.denodo_username = "admin"
+if 'denodo_password' not in st.session_state:
+    st.session_state.denodo_password = "admin"
+if 'result_partition' not in st.session_state:
+    # Cache partition of the principal that fetched the current AI SDK result
+    st.session_state.result_partition = None
+if 'selected_verified_query' not in st.session_state:
+    st.session_state.selected_verified_query = None
 if 'verified_queries' not in st.session_state:
     # Load any existing verified queries from the YAML file
+    import yaml
     if os.path.exists(YAML_FILE_PATH):
         with open(YAML_FILE_PATH, 'r') as file:
             try:
@@ -76,7 +93,8 @@ if 'verified_queries' not in st.session_state:
         st.session_state.verified_queries = {'verified_queries': []}
 
 # Function to call the Denodo AI SDK API
-def query_denodo_ai_sdk(question):
+def query_denodo_ai_sdk(question, auth, session=None, timeout=AI_SDK_TIMEOUT_SECONDS):
+    import requests
     try:
         # Prepare the request
         payload = {
@@ -90,17 +108,14 @@ def query_denodo_ai_sdk(question):
             "Accept": "application/json"
         }
         
-        # Basic authentication credentials
-        auth = ("admin", "admin")
-        
         # Make the request to the Denodo AI SDK API with basic auth
-        response = requests.post(API_ENDPOINT, json=payload, headers=headers, auth=auth)
+        response = (session or requests).post(API_ENDPOINT, json=payload, headers=headers, auth=auth, timeout=timeout)
         response.raise_for_status()  # Raise an exception for 4XX/5XX responses
         
         return response.json()
     except requests.exceptions.RequestException as e:
-        st.error(f"Error connecting to Denodo AI SDK: {str(e)}")
-        return None
+        # Runs in a worker thread, so the error is raised to the script thread to display
+        raise requests.exceptions.RequestException(f"Error connecting to Denodo AI SDK: {str(e)}") from e
 
 # Function to save verified queries to YAML file
 def save_verified_query(name, question, sql, explanation, username="data_analyst"):
@@ -118,13 +133,19 @@ def save_verified_query(name, question, sql, explanation, username="data_analyst
     st.session_state.verified_queries['verified_queries'].append(new_query)
     
     # Save to YAML file
-    with open(YAML_FILE_PATH, 'w') as file:
-        yaml.dump(st.session_state.verified_queries, file, default_flow_style=False)
+    write_verified_queries()
     
     return True
 
+# Function to write the verified queries in session state to the YAML file
+def write_verified_queries():
+    import yaml
+    with open(YAML_FILE_PATH, 'w') as file:
+        yaml.dump(st.session_state.verified_queries, file, default_flow_style=False)
+
 # Function to convert the execution result to a DataFrame
 def execution_result_to_df(execution_result):
+    import pandas as pd
     if not execution_result:
         return pd.DataFrame()
     
@@ -155,6 +176,11 @@ with st.sidebar:
     # User information (could be enhanced with authentication)
     username = st.text_input("Your Name", value="data_analyst")
     
+    # Denodo credentials used for the AI SDK and query execution
+    st.session_state.denodo_username = st.text_input("Denodo Username", value=st.session_state.denodo_username)
+    st.session_state.denodo_password = st.text_input("Denodo Password", value=st.session_state.denodo_password, type="password")
+    denodo_auth = (st.session_state.denodo_username, st.session_state.denodo_password)
+    
     tab1, tab2 = st.tabs(["Recent Queries", "Verified Queries"])
     
     with tab1:
@@ -174,6 +200,7 @@ with st.sidebar:
                     st.session_state.current_question = query['question']
                     st.session_state.edited_sql = query['sql']
                     st.session_state.query_name = query['name']
+                    st.session_state.selected_verified_query = query
                     st.experimental_rerun()
         else:
             st.info("No verified queries yet. Validate a query to add it here!")
@@ -192,24 +219,58 @@ with col2:
 if execute_btn and question:
     # Update session state
     st.session_state.current_question = question
+    st.session_state.selected_verified_query = None
+    
+    import requests
+    from background_request import BackgroundRequest, RequestCancelled, wait_for_request
+    
+    # Call the Denodo AI SDK in the background so it can be cancelled
+    request = BackgroundRequest(query_denodo_ai_sdk, question, denodo_auth, timeout=AI_SDK_TIMEOUT_SECONDS,
+                                session=get_session(*denodo_auth))
+    wait_for_request(request, "Generating SQL and fetching results...")
+    try:
+        result = request.result()
+    except RequestCancelled as e:
+        st.warning(f"AI SDK request stopped: {str(e)}")
+        result = None
+    except requests.exceptions.RequestException as e:
+        st.error(str(e))
+        result = None
     
-    with st.spinner("Generating SQL and fetching results..."):
-        # Call the Denodo AI SDK
-        result = query_denodo_ai_sdk(question)
+    if result:
+        # Update session state with the response
+        st.session_state.current_query = result.get("sql_query", "")
+        st.session_state.current_execution_result = result.get("execution_result", {})
+        st.session_state.current_query_explanation = result.get("query_explanation", "")
+        st.session_state.tables_used = result.get("tables_used", [])
+        st.session_state.edited_sql = result.get("sql_query", "")
+        st.session_state.result_partition = cache_partition(*denodo_auth)
         
-        if result:
-            # Update session state with the response
-            st.session_state.current_query = result.get("sql_query", "")
-            st.session_state.current_execution_result = result.get("execution_result", {})
-            st.session_state.current_query_explanation = result.get("query_explanation", "")
-            st.session_state.tables_used = result.get("tables_used", [])
-            st.session_state.edited_sql = result.get("sql_query", "")
-            
-            # Add to query history if not already there
-            if (question, st.session_state.current_query) not in st.session_state.query_history:
-                st.session_state.query_history.insert(0, (question, st.session_state.current_query))
-                # Keep only the most recent 10 queries
-                st.session_state.query_history = st.session_state.query_history[:10]
+        # Add to query history if not already there
+        if (question, st.session_state.current_query) not in st.session_state.query_history:
+            st.session_state.query_history.insert(0, (question, st.session_state.current_query))
+            # Keep only the most recent 10 queries
+            st.session_state.query_history = st.session_state.query_history[:10]
+
+# Show the last known result of the selected verified query from its snapshot,
+# only to principals whose credentials Denodo has accepted
+selected = st.session_state.selected_verified_query
+if selected and snapshots_available():
+    st.header(f"Last Known Result: {selected['name']}")
+    partition = cache_partition(*denodo_auth)
+    snapshot = None
+    if partition is None:
+        st.info("Result snapshots are shown once Denodo has accepted your credentials. Execute a question first.")
+    else:
+        try:
+            snapshot = load_snapshot(selected['name'], selected['sql'], partition)
+        except Exception as e:
+            st.warning(f"Could not read result snapshot: {str(e)}")
+    if snapshot:
+        st.caption(f"Snapshot refreshed at {snapshot['refreshed_at'].strftime('%d %B %Y %H:%M')}, {snapshot['row_count']} rows")
+        st.dataframe(snapshot['table'], use_container_width=True)
+    elif partition is not None:
+        st.info("No result snapshot for this query yet.")
 
 # Display results if available
 if st.session_state.current_query:
@@ -240,6 +301,33 @@ if st.session_state.current_query:
     # Editable SQL
     st.session_state.edited_sql = st.text_area("Edit SQL Query if needed", value=st.session_state.edited_sql, height=200)
     
+    # Expected cost of the edited SQL, from the assistant's runs of the same query
+    # shape or the last re-validation of the selected verified query
+    selected = st.session_state.selected_verified_query
+    if not selected or selected.get('sql') != st.session_state.edited_sql:
+        selected = None
+    guard = check_query(st.session_state.edited_sql, expected_runtime(st.session_state.edited_sql, selected))
+    if guard['expected_runtime_ms'] is not None:
+        st.info(f"Expected runtime: {guard['expected_runtime_ms'] / 1000:.1f}s")
+    else:
+        st.info("No runtime history for this query yet; only the unbounded-scan check applies. Use Show Execution Plan to review its cost.")
+    if guard['action'] == 'block':
+        st.error(f"The assistant will block this query: {guard['reason']}.")
+    elif guard['action'] == 'limit':
+        st.warning(f"The assistant will add a row limit to this query: {guard['reason']}.")
+    
+    if st.button("Show Execution Plan"):
+        import requests
+        try:
+            st.json(fetch_query_plan(st.session_state.edited_sql, denodo_auth))
+        except requests.exceptions.RequestException as e:
+            st.error(f"Could not get the execution plan: {str(e)}")
+    
+    # The AI SDK result can only be snapshotted for the SQL that produced it
+    snapshot_result = False
+    if snapshots_available() and st.session_state.edited_sql == st.session_state.current_query:
+        snapshot_result = st.checkbox("Save result snapshot", value=True)
+    
     # Validation buttons
     col1, col2 = st.columns(2)
     with col1:
@@ -258,12 +346,70 @@ if st.session_state.current_query:
                 
                 if success:
                     st.success(f"Query '{st.session_state.query_name}' verified and saved successfully!")
+                
+                # The rows belong to the principal that fetched them
+                partition = st.session_state.result_partition
+                if success and snapshot_result and partition is None:
+                    st.warning("Result snapshot not saved: Denodo did not accept the credentials that fetched this result.")
+                elif success and snapshot_result:
+                    try:
+                        snapshot = save_snapshot(
+                            st.session_state.query_name,
+                            st.session_state.edited_sql,
+                            execution_result_to_df(st.session_state.current_execution_result),
+                            partition
+                        )
+                        st.success(f"Saved result snapshot with {snapshot['row_count']} rows.")
+                    except Exception as e:
+                        st.warning(f"Could not save result snapshot: {str(e)}")
     
     with col2:
         if st.button("Reset to Original"):
             st.session_state.edited_sql = st.session_state.current_query
             st.experimental_rerun()
 
+# Re-validation of the whole verified library
+st.header("Re-validate Verified Queries")
+verified_queries = st.session_state.verified_queries.get('verified_queries', [])
+if verified_queries:
+    pool_size = st.number_input("Concurrent queries", min_value=1, max_value=REVALIDATION_MAX_POOL_SIZE, value=REVALIDATION_POOL_SIZE)
+    if st.button("Re-validate All"):
+        with st.spinner(f"Executing {len(verified_queries)} verified queries..."):
+            records = revalidate_all(verified_queries, denodo_auth, int(pool_size))
+        
+        report = []
+        for query, record in zip(verified_queries, records):
+            previous = query.get('performance', {})
+            baseline = last_successful(previous) or {}
+            regressions = find_regressions(previous, record)
+            report.append({
+                'Name': query.get('name', ''),
+                'Status': record['status'],
+                'Runtime (ms)': record['runtime_ms'],
+                'Baseline Runtime (ms)': baseline.get('runtime_ms'),
+                'Rows': record['row_count'],
+                'Regressions': ", ".join(regressions),
+                'Error': record['error'] or ""
+            })
+            # Keep the latest performance metadata, and the last successful run, with the verified query
+            query['performance'] = update_performance(previous, record)
+            # A successful run replaces the runtime the query guard recorded for this query shape
+            if record['status'] == 'ok':
+                record_runtime(bind_sample_parameters(query.get('sql', ''), query.get('sample_parameters', {})), record['runtime_ms'])
+        
+        write_verified_queries()
+        
+        import pandas as pd
+        report_df = pd.DataFrame(report)
+        regression_count = int((report_df['Regressions'] != "").sum())
+        if regression_count:
+            st.warning(f"{regression_count} of {len(report)} verified queries regressed.")
+        else:
+            st.success(f"All {len(report)} verified queries re-validated without regressions.")
+        st.dataframe(report_df, use_container_width=True)
+else:
+    st.info("No verified queries to re-validate yet.")
+
 # Footer
 st.markdown("---")
 st.markdown("Denodo SQL Query Validator App | Built with Streamlit")
\ No newline at end of file
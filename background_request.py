@@ -0,0 +1,176 @@
+import time
+import socket
+import threading
+from typing import Any, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Default deadline for a background request, in seconds
+REQUEST_TIMEOUT_SECONDS = 120
+# Connections kept per host by a session, enough for concurrent re-validation
+POOL_MAXSIZE = 16
+
+class RequestCancelled(Exception):
+    """Raised by BackgroundRequest.result() after the request was cancelled or timed out."""
+
+# Background request served by each worker thread, so new connections can find their owner
+_requests_by_thread = {}
+
+class _TrackedHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        request = _requests_by_thread.get(threading.get_ident())
+        if request:
+            request._attach(self)
+
+class _TrackedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        request = _requests_by_thread.get(threading.get_ident())
+        if request:
+            request._attach(self)
+
+# Pooled keep-alive connections do not connect() again, so attach them on checkout too
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        request = _requests_by_thread.get(threading.get_ident())
+        if request:
+            request._attach(conn)
+        return conn
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        request = _requests_by_thread.get(threading.get_ident())
+        if request:
+            request._attach(conn)
+        return conn
+
+class _TrackedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool
+        }
+
+def new_session() -> requests.Session:
+    """Create a requests session whose requests can be aborted by BackgroundRequest."""
+    session = requests.Session()
+    session.mount("http://", _TrackedAdapter(pool_maxsize=POOL_MAXSIZE))
+    session.mount("https://", _TrackedAdapter(pool_maxsize=POOL_MAXSIZE))
+    return session
+
+class BackgroundRequest:
+    """
+    Run an HTTP request function in a worker thread with a deadline. The
+    function is called with `session` and `timeout` keyword arguments;
+    cancel() shuts down the session's socket so the request is aborted
+    instead of being left running on the server. Pass a session created by
+    new_session() to reuse it; otherwise a new one is used and closed.
+    """
+
+    def __init__(self, fn: Callable[..., Any], *args, timeout: float = REQUEST_TIMEOUT_SECONDS,
+                 session: Optional[requests.Session] = None, **kwargs):
+        self.timeout = timeout
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.cancelled = False
+        self.timed_out = False
+        self._connection = None
+        self._lock = threading.Lock()
+        self._session = session
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._future = executor.submit(self._run, fn, args, kwargs)
+        executor.shutdown(wait=False)
+
+    def _run(self, fn, args, kwargs):
+        _requests_by_thread[threading.get_ident()] = self
+        session = self._session or new_session()
+        try:
+            return fn(*args, session=session, timeout=self.timeout, **kwargs)
+        finally:
+            self.finished_at = time.monotonic()
+            # A pooled connection goes back to the session and must not be aborted later
+            with self._lock:
+                self._connection = None
+            if session is not self._session:
+                session.close()
+            _requests_by_thread.pop(threading.get_ident(), None)
+
+    def _attach(self, connection):
+        with self._lock:
+            self._connection = connection
+            if self.cancelled:
+                self._abort()
+
+    def _abort(self):
+        sock = getattr(self._connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def elapsed(self) -> float:
+        """Seconds since the request started, or its runtime once it has finished."""
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def expired(self) -> bool:
+        return self.elapsed() > self.timeout
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def cancel(self, timed_out: bool = False):
+        """Abort the request; the worker thread finishes with a connection error."""
+        if self._future.done():
+            return
+        with self._lock:
+            if not self.cancelled:
+                self.cancelled = True
+                self.timed_out = timed_out
+            self._future.cancel()
+            if self._connection is not None:
+                self._abort()
+
+    def result(self) -> Any:
+        """Return the function's result or raise its exception (or RequestCancelled)."""
+        if self.cancelled:
+            if self.timed_out:
+                raise RequestCancelled(f"Request exceeded the {self.timeout:.0f}s time limit")
+            raise RequestCancelled("Request was cancelled")
+        return self._future.result()
+
+def wait_for_request(request: BackgroundRequest, label: str):
+    """
+    Show elapsed time and a Cancel button until the request finishes or its
+    deadline passes. Clicking Cancel (or any other widget) reruns the script,
+    which interrupts this loop; the request is then aborted on the way out.
+    """
+    status = st.empty()
+    cancel = st.empty()
+    cancel.button("Cancel", key="cancel_request", on_click=request.cancel)
+    try:
+        while not request.done():
+            if request.expired():
+                request.cancel(timed_out=True)
+                break
+            status.text(f"{label} {request.elapsed():.0f}s elapsed (limit {request.timeout:.0f}s)")
+            time.sleep(0.2)
+    finally:
+        if not request.done():
+            request.cancel()
+        status.empty()
+        cancel.empty()
\ No newline at end of file
@@ -0,0 +1,395 @@
+"""
+Offline evaluation of query-matching strategies.
+
+Scores each strategy on a labeled dataset (eval_dataset.yaml) for match
+precision/recall, correctness of the final SQL, LLM calls, tokens and latency,
+and writes a comparison report. LLM calls are answered from recorded responses
+(eval_recordings.yaml), keyed by a hash of the exact prompt, so the evaluation
+runs fully offline.
+
+    python matcher_eval.py [--report matcher_eval_report.md]
+    python matcher_eval.py --write-missing   # add placeholders for unrecorded prompts
+    python matcher_eval.py --record          # record missing responses with OpenAI (OPENAI_API_KEY)
+"""
+import os
+import re
+import math
+import time
+import hashlib
+import argparse
+from collections import Counter
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import yaml
+
+from query_matcher import (
+    MATCH_SIMILARITY_THRESHOLD, MODIFICATION_SIMILARITY_THRESHOLD, MATCH_PROMPT_TEMPLATE,
+    MATCH_REPAIR_TEMPLATE, ADJUST_SQL_TEMPLATE, format_verified_queries, parse_match_response
+)
+
+# Configuration
+DATASET_PATH = "eval_dataset.yaml"
+RECORDINGS_PATH = "eval_recordings.yaml"
+VERIFIED_QUERIES_PATH = "verified_queries.yaml"
+REPORT_PATH = "matcher_eval_report.md"
+# Minimum retrieval score for retrieval-only and slot-filling matches
+RETRIEVAL_THRESHOLD = 0.35
+# Candidates passed to the LLM by retrieval + rerank, and the score below which it skips the LLM
+RERANK_TOP_K = 3
+RERANK_MIN_SCORE = 0.15
+
+STOPWORDS = {"a", "an", "the", "in", "of", "on", "for", "to", "is", "are", "was", "were", "be", "by",
+             "and", "or", "with", "what", "which", "me", "show", "give", "there", "that", "this", "per"}
+
+class MissingRecording(Exception):
+    """Raised when a prompt has no recorded response and live recording is off."""
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+# Token count of a prompt or response; tiktoken is used when installed
+def estimate_tokens(text: str) -> int:
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except ImportError:
+        return max(1, len(text) // 4)
+
+class RecordedLLM:
+    """
+    Answers prompts from recordings and accounts for calls, tokens and the
+    latency measured when each response was recorded. Responses that were
+    not recorded from a model (source other than 'recorded') count as stubs.
+    With `live` set, missing prompts are sent to it and recorded.
+    """
+
+    def __init__(self, recordings: Dict[str, Dict[str, Any]], live: Optional[Callable[[str], str]] = None):
+        self.recordings = recordings
+        self.live = live
+        self.missing: Dict[str, str] = {}
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.tokens = 0
+        self.latency_ms = 0.0
+        self.unknown_latency = 0
+        self.stub_responses = 0
+
+    def __call__(self, prompt: str) -> str:
+        key = prompt_hash(prompt)
+        entry = self.recordings.get(key)
+        if entry is None or entry.get('response') is None:
+            if self.live is None:
+                self.missing[key] = prompt
+                raise MissingRecording(key)
+            start = time.perf_counter()
+            response = self.live(prompt)
+            entry = {
+                'prompt': prompt,
+                'response': response,
+                'latency_ms': round((time.perf_counter() - start) * 1000),
+                'source': 'recorded'
+            }
+            self.recordings[key] = entry
+
+        self.calls += 1
+        if entry.get('source') != 'recorded':
+            self.stub_responses += 1
+        self.tokens += estimate_tokens(prompt) + estimate_tokens(entry['response'])
+        if entry.get('latency_ms') is None:
+            self.unknown_latency += 1
+        else:
+            self.latency_ms += entry['latency_ms']
+        return entry['response']
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+class TfidfIndex:
+    """Bag-of-words TF-IDF retrieval over the verified queries, standing in for embeddings offline."""
+
+    def __init__(self, documents: List[str]):
+        tokenized = [tokenize(document) for document in documents]
+        document_frequency = Counter(token for tokens in tokenized for token in set(tokens))
+        self.idf = {token: math.log((1 + len(documents)) / (1 + df)) + 1 for token, df in document_frequency.items()}
+        self.vectors = [self._vector(tokens) for tokens in tokenized]
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        counts = Counter(token for token in tokens if token in self.idf)
+        vector = {token: count * self.idf[token] for token, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {token: value / norm for token, value in vector.items()}
+
+    def search(self, text: str) -> List[Tuple[int, float]]:
+        query = self._vector(tokenize(text))
+        scores = [(i, sum(query.get(token, 0.0) * value for token, value in vector.items()))
+                  for i, vector in enumerate(self.vectors)]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+# Normalized SQL used to decide whether the final SQL is correct
+def normalize_sql(sql: Optional[str]) -> Optional[str]:
+    if sql is None:
+        return None
+    sql = re.sub(r'--[^\n]*', '', sql)
+    sql = re.sub(r'/\*.*?\*/', '', sql, flags=re.DOTALL)
+    return re.sub(r'\s+', ' ', sql).strip().rstrip(';').strip().lower()
+
+def normalize_question(question: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+# Template slot-filling: a status literal followed by a comment listing its options, and years
+STATUS_SLOT = re.compile(r"=\s*'([^']*)'(?=[ \t]*--([^\n]*))")
+YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+
+def _question_slots(question: str, statuses: List[str]) -> Dict[str, Optional[str]]:
+    words = set(re.findall(r"[a-z]+", question.lower()))
+    years = YEAR_PATTERN.findall(question)
+    return {
+        "year": years[0] if years else None,
+        "status": next((status for status in statuses if status in words), None)
+    }
+
+def fill_template(verified_query: Dict[str, Any], question: str) -> str:
+    """
+    Adapt a verified query without an LLM: the year and status that differ
+    between its question and the new one are substituted in the SQL,
+    including the status word in column aliases.
+    """
+    sql = verified_query.get('sql', '')
+    slot = STATUS_SLOT.search(sql)
+    statuses = []
+    if slot:
+        statuses = [option.strip().lower() for option in slot.group(2).split(',') if option.strip()]
+        statuses.append(slot.group(1).lower())
+
+    old = _question_slots(verified_query.get('question', ''), statuses)
+    new = _question_slots(question, statuses)
+
+    if old["year"] and new["year"] and old["year"] != new["year"]:
+        sql = sql.replace(f"'{old['year']}-", f"'{new['year']}-")
+
+    if slot and old["status"] and new["status"] and old["status"] != new["status"]:
+        sql = sql[:slot.start(1)] + new["status"] + sql[slot.end(1):]
+        sql = re.sub(
+            r'"[^"]*"',
+            lambda m: re.sub(rf'\b{old["status"]}\b', new["status"].capitalize(), m.group(0), flags=re.IGNORECASE),
+            sql
+        )
+
+    return sql
+
+# Match over a list of candidate queries with the assistant's prompts, as find_matching_query does
+def _llm_match(question: str, candidates: List[Dict[str, Any]], llm: RecordedLLM) -> Dict[str, Any]:
+    response = llm(MATCH_PROMPT_TEMPLATE.format(question=question, verified_queries=format_verified_queries(candidates)))
+    try:
+        response_json = parse_match_response(response, len(candidates))
+    except ValueError as e:
+        response = llm(MATCH_REPAIR_TEMPLATE.format(error=str(e), response=response))
+        try:
+            response_json = parse_match_response(response, len(candidates))
+        except ValueError:
+            return {"query": None, "sql": None}
+
+    query_number = response_json["query_number"]
+    if not response_json["match"]:
+        return {"query": None, "sql": None}
+
+    if response_json["modification_needed"]:
+        threshold = MODIFICATION_SIMILARITY_THRESHOLD
+    else:
+        threshold = MATCH_SIMILARITY_THRESHOLD
+    if response_json["similarity"] < threshold:
+        return {"query": None, "sql": None}
+
+    query = candidates[query_number - 1]
+    sql = query.get('sql', '')
+    if response_json["modification_needed"] and response_json["modifications"]:
+        sql = llm(ADJUST_SQL_TEMPLATE.format(original_sql=sql, modifications=response_json["modifications"])).strip()
+    return {"query": query, "sql": sql}
+
+def strategy_exact(question: str, verified_queries: List[Dict[str, Any]], index: TfidfIndex, llm: RecordedLLM) -> Dict[str, Any]:
+    """Exact match on the normalized question text."""
+    for query in verified_queries:
+        if normalize_question(query.get('question', '')) == normalize_question(question):
+            return {"query": query, "sql": query.get('sql', '')}
+    return {"query": None, "sql": None}
+
+def strategy_retrieval(question: str, verified_queries: List[Dict[str, Any]], index: TfidfIndex, llm: RecordedLLM) -> Dict[str, Any]:
+    """Best retrieval hit above RETRIEVAL_THRESHOLD, SQL used unchanged."""
+    best, score = index.search(question)[0]
+    if score < RETRIEVAL_THRESHOLD:
+        return {"query": None, "sql": None}
+    return {"query": verified_queries[best], "sql": verified_queries[best].get('sql', '')}
+
+def strategy_retrieval_rerank(question: str, verified_queries: List[Dict[str, Any]], index: TfidfIndex, llm: RecordedLLM) -> Dict[str, Any]:
+    """Top RERANK_TOP_K retrieval hits reranked and adjusted by the LLM."""
+    hits = [i for i, score in index.search(question)[:RERANK_TOP_K] if score >= RERANK_MIN_SCORE]
+    if not hits:
+        return {"query": None, "sql": None}
+    return _llm_match(question, [verified_queries[i] for i in hits], llm)
+
+def strategy_llm_prompt(question: str, verified_queries: List[Dict[str, Any]], index: TfidfIndex, llm: RecordedLLM) -> Dict[str, Any]:
+    """The assistant's current flow: one prompt over every verified query, then adjust_sql."""
+    return _llm_match(question, verified_queries, llm)
+
+def strategy_slot_filling(question: str, verified_queries: List[Dict[str, Any]], index: TfidfIndex, llm: RecordedLLM) -> Dict[str, Any]:
+    """Best retrieval hit adapted by template slot-filling, without an LLM."""
+    best, score = index.search(question)[0]
+    if score < RETRIEVAL_THRESHOLD:
+        return {"query": None, "sql": None}
+    return {"query": verified_queries[best], "sql": fill_template(verified_queries[best], question)}
+
+STRATEGIES = {
+    "exact": strategy_exact,
+    "retrieval": strategy_retrieval,
+    "retrieval_rerank": strategy_retrieval_rerank,
+    "llm_prompt": strategy_llm_prompt,
+    "slot_filling": strategy_slot_filling
+}
+
+def evaluate(name: str, strategy: Callable, cases: List[Dict[str, Any]], verified_queries: List[Dict[str, Any]],
+             index: TfidfIndex, llm: RecordedLLM) -> Dict[str, Any]:
+    """Run one strategy over every case and aggregate its scores."""
+    totals = {"tp": 0, "fp": 0, "fn": 0, "sql_correct": 0, "llm_calls": 0, "tokens": 0,
+              "compute_ms": 0.0, "llm_latency_ms": 0.0, "unknown_latency": 0, "stub_responses": 0, "missing": 0}
+    outcomes = []
+    for case in cases:
+        llm.reset()
+        start = time.perf_counter()
+        try:
+            result = strategy(case["question"], verified_queries, index, llm)
+        except MissingRecording:
+            result = None
+            totals["missing"] += 1
+        totals["compute_ms"] += (time.perf_counter() - start) * 1000
+        totals["llm_calls"] += llm.calls
+        totals["tokens"] += llm.tokens
+        totals["llm_latency_ms"] += llm.latency_ms
+        totals["unknown_latency"] += llm.unknown_latency
+        totals["stub_responses"] += llm.stub_responses
+
+        if result is None:
+            outcomes.append("missing recording")
+            continue
+
+        predicted = result["query"].get('name') if result["query"] else None
+        expected = case.get("expected_query")
+        if predicted is not None and predicted == expected:
+            totals["tp"] += 1
+        elif predicted is not None:
+            totals["fp"] += 1
+        if expected is not None and predicted != expected:
+            totals["fn"] += 1
+
+        if expected is None:
+            correct = predicted is None
+        else:
+            correct = predicted == expected and normalize_sql(result["sql"]) == normalize_sql(case.get("expected_sql"))
+        totals["sql_correct"] += int(correct)
+        if correct:
+            outcome = "correct"
+        elif predicted is None:
+            outcome = "no match"
+        else:
+            outcome = "wrong SQL" if predicted == expected else "wrong match"
+        outcomes.append(f"{outcome} (stub)" if llm.stub_responses else outcome)
+
+    matched = totals["tp"] + totals["fp"]
+    expected_matches = totals["tp"] + totals["fn"]
+    return {
+        "strategy": name,
+        "precision": totals["tp"] / matched if matched else None,
+        "recall": totals["tp"] / expected_matches if expected_matches else None,
+        "sql_accuracy": totals["sql_correct"] / len(cases) if cases else None,
+        "outcomes": outcomes,
+        **totals
+    }
+
+def _percent(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:.0%}"
+
+def format_report(results: List[Dict[str, Any]], cases: List[Dict[str, Any]]) -> str:
+    lines = [
+        "# Matcher Evaluation",
+        "",
+        f"{len(cases)} labeled questions. LLM latency is the latency measured when each response was recorded."
+    ]
+    stubs = sum(r["stub_responses"] for r in results)
+    if stubs:
+        calls = sum(r["llm_calls"] for r in results)
+        lines += [
+            "",
+            f"> **Not measured:** {stubs} of {calls} LLM responses in this run are hand-written stubs, not model "
+            "output. Scores marked \"stub\" only reflect those stubs and their latency is unknown. "
+            "Run `python matcher_eval.py --record` to measure them."
+        ]
+    lines += [
+        "",
+        "| Strategy | Precision | Recall | SQL accuracy | LLM calls | Stub responses | Tokens | Compute (ms) | LLM latency (ms) | Missing recordings |",
+        "|---|---|---|---|---|---|---|---|---|---|"
+    ]
+    for r in results:
+        if r["unknown_latency"] and r["unknown_latency"] == r["llm_calls"]:
+            latency = "unmeasured"
+        else:
+            latency = f"{r['llm_latency_ms']:.0f}"
+            if r["unknown_latency"]:
+                latency += f" (+{r['unknown_latency']} unmeasured)"
+        marker = " (stub)" if r["stub_responses"] else ""
+        lines.append(
+            f"| {r['strategy']} | {_percent(r['precision'])}{marker} | {_percent(r['recall'])}{marker} "
+            f"| {_percent(r['sql_accuracy'])}{marker} | {r['llm_calls']} | {r['stub_responses']} | {r['tokens']} "
+            f"| {r['compute_ms']:.1f} | {latency} | {r['missing']} |"
+        )
+
+    lines += ["", "## Per question", "", "| Question | " + " | ".join(r["strategy"] for r in results) + " |",
+              "|---|" + "---|" * len(results)]
+    for i, case in enumerate(cases):
+        lines.append(f"| {case['question']} | " + " | ".join(r["outcomes"][i] for r in results) + " |")
+    return "\n".join(lines) + "\n"
+
+def _load_yaml(path: str, key: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as file:
+        data = yaml.safe_load(file) or {}
+    return data.get(key) or default
+
+def _openai_llm() -> Callable[[str], str]:
+    from langchain.llms import OpenAI
+    llm = OpenAI(temperature=0, api_key=os.environ["OPENAI_API_KEY"])
+    return llm.predict
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--report", default=REPORT_PATH, help="markdown report to write")
+    parser.add_argument("--strategies", nargs="+", choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument("--write-missing", action="store_true", help="add placeholders for prompts without a recording")
+    parser.add_argument("--record", action="store_true", help="record missing responses with OpenAI")
+    args = parser.parse_args()
+
+    cases = _load_yaml(DATASET_PATH, 'cases', [])
+    verified_queries = _load_yaml(VERIFIED_QUERIES_PATH, 'verified_queries', [])
+    recordings = _load_yaml(RECORDINGS_PATH, 'recordings', {})
+
+    index = TfidfIndex([
+        f"{q.get('name', '')} {q.get('question', '')} {q.get('query_explanation', '')}" for q in verified_queries
+    ])
+    llm = RecordedLLM(recordings, live=_openai_llm() if args.record else None)
+    results = [evaluate(name, STRATEGIES[name], cases, verified_queries, index, llm) for name in args.strategies]
+
+    report = format_report(results, cases)
+    print(report)
+    with open(args.report, 'w') as file:
+        file.write(report)
+
+    if args.write_missing:
+        for key, prompt in llm.missing.items():
+            recordings[key] = {'prompt': prompt, 'response': None, 'latency_ms': None, 'source': 'missing'}
+    if args.record or (args.write_missing and llm.missing):
+        with open(RECORDINGS_PATH, 'w') as file:
+            yaml.dump({'recordings': recordings}, file, default_flow_style=False, allow_unicode=True, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+
+from vql_client import post_vql, strip_comments_and_literals, strip_statement_end, RESULT_ROW_LIMIT, SQL_TOKEN_PATTERN
+from session_manager import get_session
+from revalidation import last_successful
+
+# Queries expected to run longer than this are limited or blocked
+MAX_EXPECTED_RUNTIME_MS = 30000
+# Row limit added to slow or unbounded queries that do not aggregate
+AUTO_LIMIT_ROWS = RESULT_ROW_LIMIT
+# Runtimes of the queries the assistant executed, by query shape, so SQL that is
+# not a verified query (adjusted, AI SDK generated or edited) has an estimate too
+RUNTIME_HISTORY_PATH = "query_runtimes.json"
+RUNTIME_HISTORY_MAX_ENTRIES = 1000
+# Recorded runtimes older than this are ignored, so a slow run does not block a shape for good
+RUNTIME_HISTORY_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+_history_lock = threading.Lock()
+
+AGGREGATE_PATTERN = re.compile(r'\b(COUNT|SUM|AVG|MIN|MAX)\s*\(|\bGROUP\s+BY\b', re.IGNORECASE)
+WHERE_PATTERN = re.compile(r'\bWHERE\b', re.IGNORECASE)
+LIMIT_PATTERN = re.compile(r'\bLIMIT\s+\d+|\bFETCH\s+(FIRST|NEXT)\b', re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r'\b\d+(\.\d+)?\b')
+
+def add_limit(sql: str, limit: int = AUTO_LIMIT_ROWS) -> str:
+    """Append a LIMIT clause to a query."""
+    return f"{strip_statement_end(sql)}\nLIMIT {limit}"
+
+# Runtime of a verified query's last successful re-validation
+def historical_runtime(verified_query: Optional[Dict[str, Any]]) -> Optional[int]:
+    if not verified_query:
+        return None
+    performance = last_successful(verified_query.get('performance')) or {}
+    return performance.get('runtime_ms')
+
+# Time of a verified query's last successful re-validation
+def _validated_at(verified_query: Optional[Dict[str, Any]]) -> Optional[datetime]:
+    performance = last_successful((verified_query or {}).get('performance')) or {}
+    try:
+        return datetime.strptime(performance['validated_at'], "%d %B %Y %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        return None
+
+# Queries that differ only in literal values (strings and numbers) or comments share a shape
+def query_shape(sql: str) -> str:
+    code = strip_statement_end(strip_comments_and_literals(sql))
+    # Numbers inside quoted identifiers are part of the name
+    code = "".join(token if token.startswith('"') else NUMBER_PATTERN.sub('0', token) for token in SQL_TOKEN_PATTERN.findall(code))
+    code = re.sub(r'\s+', ' ', code).strip().lower()
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+def _is_expired(entry: Dict[str, Any], now: datetime) -> bool:
+    return now - datetime.fromisoformat(entry['recorded_at']) > timedelta(seconds=RUNTIME_HISTORY_MAX_AGE_SECONDS)
+
+def _load_runtime_history() -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(RUNTIME_HISTORY_PATH):
+        return {}
+    try:
+        with open(RUNTIME_HISTORY_PATH, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def record_runtime(sql: str, runtime_ms: int):
+    """Record the runtime of an executed query. The history is best-effort, so write errors are ignored."""
+    with _history_lock:
+        history = _load_runtime_history()
+        history[query_shape(sql)] = {
+            'runtime_ms': int(runtime_ms),
+            'recorded_at': datetime.now().isoformat(timespec="seconds")
+        }
+        now = datetime.now()
+        history = {shape: entry for shape, entry in history.items() if not _is_expired(entry, now)}
+        if len(history) > RUNTIME_HISTORY_MAX_ENTRIES:
+            newest = sorted(history.items(), key=lambda item: item[1]['recorded_at'], reverse=True)
+            history = dict(newest[:RUNTIME_HISTORY_MAX_ENTRIES])
+        try:
+            tmp_path = f"{RUNTIME_HISTORY_PATH}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(history, file)
+            os.replace(tmp_path, RUNTIME_HISTORY_PATH)
+        except OSError:
+            pass
+
+# Last recorded runtime of a query with the same shape, unless it has expired
+def _recorded_entry(sql: str) -> Optional[Dict[str, Any]]:
+    entry = _load_runtime_history().get(query_shape(sql))
+    if not entry or _is_expired(entry, datetime.now()):
+        return None
+    return entry
+
+def recorded_runtime(sql: str) -> Optional[int]:
+    entry = _recorded_entry(sql)
+    return entry['runtime_ms'] if entry else None
+
+def expected_runtime(sql: str, verified_query: Optional[Dict[str, Any]] = None) -> Optional[int]:
+    """
+    Runtime estimate for a query: whichever is newer of the last execution of
+    the same query shape and the last successful re-validation of the
+    verified query it came from.
+    """
+    entry = _recorded_entry(sql)
+    if entry is None:
+        return historical_runtime(verified_query)
+    validated_at = _validated_at(verified_query)
+    if validated_at is not None and validated_at > datetime.fromisoformat(entry['recorded_at']):
+        return historical_runtime(verified_query)
+    return entry['runtime_ms']
+
+def check_query(sql: str, expected_runtime_ms: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Decide whether a query may run as-is. Returns a dict with 'action'
+    ('allow', 'limit' or 'block'), the 'sql' to execute, the 'reason' and
+    the 'expected_runtime_ms' the decision was based on.
+    """
+    code = strip_comments_and_literals(sql)
+    aggregating = bool(AGGREGATE_PATTERN.search(code))
+    limited = bool(LIMIT_PATTERN.search(code))
+    filtered = bool(WHERE_PATTERN.search(code))
+
+    decision = {
+        'action': 'allow',
+        'sql': sql,
+        'reason': "",
+        'expected_runtime_ms': expected_runtime_ms
+    }
+
+    if expected_runtime_ms is not None and expected_runtime_ms > MAX_EXPECTED_RUNTIME_MS:
+        reason = f"expected runtime {expected_runtime_ms / 1000:.1f}s exceeds {MAX_EXPECTED_RUNTIME_MS / 1000:.0f}s"
+        if aggregating or limited:
+            # A row limit does not shorten an aggregation or an already limited query
+            decision.update(action='block', reason=reason)
+        else:
+            decision.update(action='limit', sql=add_limit(sql), reason=reason)
+    elif expected_runtime_ms is None and not (filtered or aggregating or limited):
+        decision.update(action='limit', sql=add_limit(sql), reason="no WHERE clause, aggregation or limit (unbounded scan)")
+
+    return decision
+
+def fetch_query_plan(sql: str, auth: Tuple[str, str]) -> Dict[str, Any]:
+    """
+    Ask VDP for the execution plan of a query with DESC QUERYPLAN. Raises
+    requests.RequestException if the Data Catalog rejects the statement.
+    """
+    return post_vql(f"DESC QUERYPLAN {strip_statement_end(sql)}", auth, session=get_session(*auth))
\ No newline at end of file
@@ -0,0 +1,174 @@
+import json
+from typing import Dict, Any, List, Optional
+
+# Matching thresholds (similarity is reported by the matcher on a 0-100 scale).
+# Matches below MATCH_SIMILARITY_THRESHOLD go straight to the AI SDK; matches that
+# need SQL modifications must also reach MODIFICATION_SIMILARITY_THRESHOLD, since
+# they cost an extra adjust_sql round-trip and are more likely to be wrong.
+MATCH_SIMILARITY_THRESHOLD = 80
+MODIFICATION_SIMILARITY_THRESHOLD = 85
+
+# Schema the matcher output must satisfy: key -> expected type
+MATCH_RESPONSE_SCHEMA = {
+    "match": bool,
+    "query_number": int,
+    "similarity": float,
+    "modification_needed": bool,
+    "modifications": str,
+}
+
+# Prompt used to match a user question against the verified queries
+MATCH_PROMPT_TEMPLATE = """You are an expert at matching user questions with verified SQL queries.
+Your task is to analyze the user's question and find the most similar verified query.
+
+Follow these comparison rules carefully:
+1. Core Query Components:
+   - What is being counted/summed/averaged?
+   - Which time period is being queried?
+   - What status or category filters are needed?
+
+2. Pattern Matching:
+   - Match main action (count, sum, etc.)
+   - Match time period (specific year)
+   - Match status (delivered, canceled, shipped, etc.)
+   - Look for status values in SQL comments
+
+3. Modification Requirements:
+   - List ALL required changes in modifications
+   - Include both year AND status changes when needed
+   - Be explicit about which status value to use
+   - Use values from SQL comments when available
+
+Output a SINGLE LINE JSON:
+{{"match":boolean,"query_number":integer,"similarity":integer 0-100,"modification_needed":boolean,"modifications":string}}
+"similarity" is an integer from 0 (unrelated) to 100 (same question), not a fraction.
+
+Example modifications:
+- Multiple changes: {{"match":true,"query_number":1,"similarity":95,"modification_needed":true,"modifications":"Change year from 2018 to 2017 in WHERE clause AND update order_status from 'canceled' to 'shipped' (value from comment)"}}
+- Status only: {{"match":true,"query_number":1,"similarity":90,"modification_needed":true,"modifications":"Update order_status from 'delivered' to 'shipped' using value from comment"}}
+- Year only: {{"match":true,"query_number":1,"similarity":85,"modification_needed":true,"modifications":"Change year from 2018 to 2017 in WHERE clause"}}
+
+User Question: {question}
+
+Previously verified queries:
+{verified_queries}
+
+Output JSON:"""
+
+# Template used to ask the LLM to fix a matcher response that failed validation
+MATCH_REPAIR_TEMPLATE = """Your previous answer could not be parsed: {error}
+
+Previous answer:
+{response}
+
+Return ONLY a single line JSON object with exactly these keys and types:
+{{"match":boolean,"query_number":integer,"similarity":integer 0-100,"modification_needed":boolean,"modifications":string}}
+"similarity" is an integer from 0 (unrelated) to 100 (same question), not a fraction.
+
+Output JSON:"""
+
+# Parse and validate the matcher output against MATCH_RESPONSE_SCHEMA
+def parse_match_response(response: str, query_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Extract the JSON object from the raw LLM response and coerce it to the
+    expected schema. With query_count, a match must also name one of that
+    many queries. Raises ValueError if the response does not conform.
+    """
+    start = response.find("{")
+    end = response.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object found in response")
+
+    response_json = json.loads(response[start:end + 1])
+    if not isinstance(response_json, dict):
+        raise ValueError("Response is not a JSON object")
+
+    # A "no match" answer needs no other fields (models often send null for them)
+    if response_json.get("match") is False:
+        return {"match": False, "query_number": 0, "similarity": 0.0, "modification_needed": False, "modifications": ""}
+
+    missing = [key for key in MATCH_RESPONSE_SCHEMA if key not in response_json]
+    if missing:
+        raise ValueError(f"Missing required keys: {missing}")
+
+    parsed = {}
+    for key, expected_type in MATCH_RESPONSE_SCHEMA.items():
+        value = response_json[key]
+        if expected_type is bool:
+            if not isinstance(value, bool):
+                raise ValueError(f"'{key}' must be a boolean, got {value!r}")
+            parsed[key] = value
+        elif expected_type is str:
+            parsed[key] = "" if value is None else str(value)
+        else:
+            if isinstance(value, bool):
+                raise ValueError(f"'{key}' must be a number, got {value!r}")
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{key}' must be a number, got {value!r}")
+            if expected_type is int:
+                if not number.is_integer():
+                    raise ValueError(f"'{key}' must be an integer, got {value!r}")
+                number = int(number)
+            parsed[key] = number
+
+    if not (0 <= parsed["similarity"] <= 100):
+        raise ValueError(f"'similarity' must be between 0 and 100, got {parsed['similarity']}")
+
+    if query_count is not None and parsed["match"] and not (0 < parsed["query_number"] <= query_count):
+        raise ValueError(f"'query_number' must be between 1 and {query_count}, got {parsed['query_number']}")
+
+    return parsed
+
+# Prompt used to adapt a matched verified query to the user's question
+ADJUST_SQL_TEMPLATE = """
+    You are an expert SQL developer. Your task is to analyze and modify SQL based on user requirements.
+
+    Original SQL:
+    {original_sql}
+    
+    Modification instructions:
+    {modifications}
+    
+    Rules:
+    1. Analyze ALL Components:
+       - Column aliases: Update to match the context (e.g., "Products Delivered" → "Products Shipped")
+       - SQL Comments: Extract valid status values
+       - WHERE conditions: Year and status filters
+    
+    2. ONLY modify these parts:
+       - Column aliases in SELECT clause to match the question context
+       - Year in BETWEEN clause as requested
+       - Status values using options from comments
+    
+    3. Column Alias Guidelines:
+       - Match the verb from user's question (delivered → shipped)
+       - Keep "Number of" prefix if present
+       - Maintain quote style and capitalization
+       - Example: "Number of Products Delivered" → "Number of Products Shipped"
+    
+    4. Keep Intact:
+       - Query structure
+       - Table names
+       - Aggregation functions
+       - Comment content
+    
+    Example:
+    User asks "how many orders shipped in 2017":
+    Original: SELECT COUNT(*) AS "Number of Products Delivered"
+    Modified: SELECT COUNT(*) AS "Number of Products Shipped"
+
+    Return complete SQL with both alias and condition changes.
+    """
+
+# String representation of the verified queries for MATCH_PROMPT_TEMPLATE
+def format_verified_queries(verified_queries: List[Dict[str, Any]]) -> str:
+    queries_str = ""
+    for i, query in enumerate(verified_queries):
+        queries_str += f"Query {i+1}:\n"
+        queries_str += f"Name: {query.get('name', '')}\n"
+        queries_str += f"Question: {query.get('question', '')}\n"
+        queries_str += f"SQL: {query.get('sql', '')}\n"
+        queries_str += f"Explanation: {query.get('query_explanation', '')}\n\n"
+    return queries_str
\ No newline at end of file
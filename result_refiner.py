@@ -0,0 +1,196 @@
+import re
+import json
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+# Words that point back at the previous result (anaphora, "now", "only", "top N").
+# Words common in new questions ("per", "by", "last year") are left out, since
+# every match costs an LLM call before matching starts.
+REFINEMENT_CUES = re.compile(
+    r"\b(those|these|them|same|instead|now|only|previous|above|"
+    r"(?:top|bottom|first|last)\s+\d+|"
+    r"break\s+(?:that|this|it|them)\s+down|(?:of|from)\s+(?:that|this|it)|"
+    r"(?:the|that|this)\s+results?)\b",
+    re.IGNORECASE
+)
+
+FILTER_OPERATORS = {"=", "!=", ">", ">=", "<", "<=", "contains", "in"}
+AGGREGATIONS = {"sum", "mean", "count", "count_distinct", "min", "max"}
+TIME_GRAINS = {"day": "D", "month": "M", "quarter": "Q", "year": "Y"}
+
+# Template asking the LLM for a refinement plan over the previous result
+REFINEMENT_TEMPLATE = """You decide whether a follow-up question can be answered from the previous query result alone.
+
+Previous question: {previous_question}
+Previous SQL: {previous_sql}
+Columns of the previous result (name: sample values):
+{columns}
+
+Follow-up question: {question}
+
+If the follow-up only filters, sorts, limits or re-aggregates the previous result using the columns above, describe the steps.
+If it needs any column or row that is not in the previous result, or it is a new question, set "local" to false.
+
+Output a SINGLE LINE JSON:
+{{"local":boolean,"filters":[{{"column":string,"op":"=|!=|>|>=|<|<=|contains|in","value":any}}],"group_by":[{{"column":string,"grain":null|"day"|"month"|"quarter"|"year"}}],"aggregations":[{{"column":string,"func":"sum|mean|count|count_distinct|min|max","alias":string}}],"sort":[{{"column":string,"ascending":boolean}}],"limit":number|null}}
+
+Output JSON:"""
+
+def looks_like_refinement(question: str) -> bool:
+    """Cheap check so unrelated questions do not pay for a refinement LLM call."""
+    return bool(REFINEMENT_CUES.search(question))
+
+# Describe the columns of a result for the refinement prompt
+def describe_columns(df: pd.DataFrame, samples: int = 3) -> str:
+    lines = []
+    for column in df.columns:
+        values = df[column].dropna().astype(str).unique()[:samples]
+        lines.append(f"- {column}: {', '.join(values)}")
+    return "\n".join(lines)
+
+def parse_refinement_plan(response: str, df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Parse the LLM refinement plan and check it only uses columns of df.
+    Raises ValueError if the plan is malformed or needs data df does not have.
+    """
+    start = response.find("{")
+    end = response.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object found in response")
+
+    plan = json.loads(response[start:end + 1])
+    if not isinstance(plan, dict):
+        raise ValueError("Response is not a JSON object")
+
+    plan = {
+        "local": plan.get("local") is True,
+        "filters": plan.get("filters") or [],
+        "group_by": plan.get("group_by") or [],
+        "aggregations": plan.get("aggregations") or [],
+        "sort": plan.get("sort") or [],
+        "limit": plan.get("limit")
+    }
+    if not plan["local"]:
+        return plan
+
+    available = set(df.columns)
+    for step in plan["filters"]:
+        if step.get("op") not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {step.get('op')}")
+    for step in plan["group_by"]:
+        if step.get("grain") is not None and step.get("grain") not in TIME_GRAINS:
+            raise ValueError(f"Unsupported time grain: {step.get('grain')}")
+    for step in plan["aggregations"]:
+        if step.get("func") not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {step.get('func')}")
+
+    needed = [step.get("column") for step in plan["filters"] + plan["group_by"] + plan["aggregations"]]
+    missing = [column for column in needed if column not in available]
+    if missing:
+        raise ValueError(f"Columns not in previous result: {missing}")
+
+    # Sorting may also refer to aggregation aliases
+    sortable = available | {step.get("alias") or f"{step['func']}_{step['column']}" for step in plan["aggregations"]}
+    missing = [step.get("column") for step in plan["sort"] if step.get("column") not in sortable]
+    if missing:
+        raise ValueError(f"Columns not in previous result: {missing}")
+
+    if plan["limit"] is not None:
+        plan["limit"] = int(plan["limit"])
+        if plan["limit"] <= 0:
+            raise ValueError(f"Invalid limit: {plan['limit']}")
+
+    return plan
+
+# Value of a plan filter as a number, or None; "9" and 9 are both numbers
+def _as_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Column as numbers if every non-null value parses as one, else None. AI SDK
+# results hold numbers as text, which would otherwise compare as strings.
+def _numeric_column(series: pd.Series) -> Optional[pd.Series]:
+    numeric = pd.to_numeric(series, errors='coerce')
+    return numeric if numeric.notna().sum() == series.notna().sum() else None
+
+def _apply_filter(df: pd.DataFrame, step: Dict[str, Any]) -> pd.DataFrame:
+    column, op, value = step["column"], step["op"], step.get("value")
+    if op == "contains":
+        return df[df[column].astype(str).str.contains(str(value), case=False, regex=False)]
+
+    numeric = _numeric_column(df[column])
+    if op == "in":
+        values = value if isinstance(value, list) else [value]
+        numbers = [_as_number(v) for v in values]
+        if numeric is not None and None not in numbers:
+            return df[numeric.isin(numbers)]
+        return df[df[column].astype(str).isin([str(v) for v in values])]
+
+    # Compare numerically when both the column and the value are numbers
+    number = _as_number(value)
+    if numeric is not None and number is not None:
+        series, value = numeric, number
+    else:
+        series, value = df[column].astype(str), str(value)
+    comparisons = {
+        "=": series == value,
+        "!=": series != value,
+        ">": series > value,
+        ">=": series >= value,
+        "<": series < value,
+        "<=": series <= value
+    }
+    return df[comparisons[op]]
+
+def _aggregate(df: pd.DataFrame, group_by: List[Dict[str, Any]], aggregations: List[Dict[str, Any]]) -> pd.DataFrame:
+    df = df.copy()
+    keys = []
+    for step in group_by:
+        column = step["column"]
+        if step.get("grain"):
+            periods = pd.to_datetime(df[column], errors='coerce').dt.to_period(TIME_GRAINS[step["grain"]])
+            df[column] = periods.astype(str)
+        keys.append(column)
+
+    if not aggregations:
+        aggregations = [{"column": keys[0], "func": "count", "alias": "count"}]
+
+    named = {}
+    for step in aggregations:
+        column, func = step["column"], step["func"]
+        alias = step.get("alias") or f"{func}_{column}"
+        if func in ("sum", "mean"):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        named[alias] = pd.NamedAgg(column=column, aggfunc="nunique" if func == "count_distinct" else func)
+
+    if not keys:
+        return pd.DataFrame({alias: [df[agg.column].agg(agg.aggfunc)] for alias, agg in named.items()})
+    return df.groupby(keys, dropna=False).agg(**named).reset_index()
+
+# Sort numerically when a column holds numbers stored as text
+def _sort_key(series: pd.Series) -> pd.Series:
+    numeric = pd.to_numeric(series, errors='coerce')
+    return numeric if numeric.notna().all() else series
+
+def apply_refinement(df: pd.DataFrame, plan: Dict[str, Any]) -> pd.DataFrame:
+    """Apply filters, re-aggregation, sorting and top-N from a refinement plan."""
+    for step in plan["filters"]:
+        df = _apply_filter(df, step)
+
+    if plan["group_by"] or plan["aggregations"]:
+        df = _aggregate(df, plan["group_by"], plan["aggregations"])
+
+    if plan["sort"]:
+        columns = [step["column"] for step in plan["sort"]]
+        ascending = [bool(step.get("ascending", True)) for step in plan["sort"]]
+        df = df.sort_values(columns, ascending=ascending, key=_sort_key)
+
+    if plan["limit"] is not None:
+        df = df.head(plan["limit"])
+
+    return df.reset_index(drop=True)
\ No newline at end of file
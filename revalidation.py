@@ -0,0 +1,101 @@
+import re
+import json
+import time
+import hashlib
+from typing import Dict, Any, List, Tuple, Optional
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from vql_client import post_vql, with_query_timeout
+from session_manager import get_session
+
+# A query counts as slower when its runtime grows by this factor and by at least MIN_SLOWDOWN_MS
+SLOWDOWN_FACTOR = 1.5
+MIN_SLOWDOWN_MS = 200
+
+# Substitute {name} placeholders with the entry's sample_parameters
+def bind_sample_parameters(sql: str, parameters: Dict[str, Any]) -> str:
+    if not parameters:
+        return sql
+    return re.sub(
+        r'\{(\w+)\}',
+        lambda m: str(parameters[m.group(1)]) if m.group(1) in parameters else m.group(0),
+        sql
+    )
+
+# Order-sensitive checksum of a Data Catalog result
+def result_checksum(result: Dict[str, Any]) -> str:
+    canonical = json.dumps([result.get("columnNames", []), result.get("rows", [])], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def validate_query(query: Dict[str, Any], auth: Tuple[str, str]) -> Dict[str, Any]:
+    """Execute a verified query and return its performance record."""
+    sql = bind_sample_parameters(query.get('sql', ''), query.get('sample_parameters', {}))
+    record = {
+        'validated_at': datetime.now().strftime("%d %B %Y %H:%M:%S"),
+        'status': 'ok',
+        'error': None,
+        'runtime_ms': None,
+        'row_count': None,
+        'result_checksum': None
+    }
+
+    start = time.perf_counter()
+    try:
+        result = post_vql(with_query_timeout(sql), auth, session=get_session(*auth))
+        record['row_count'] = len(result['rows'])
+        record['result_checksum'] = result_checksum(result)
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+    record['runtime_ms'] = round((time.perf_counter() - start) * 1000)
+
+    return record
+
+def revalidate_all(queries: List[Dict[str, Any]], auth: Tuple[str, str], pool_size: int = 4) -> List[Dict[str, Any]]:
+    """Run every verified query concurrently; records are returned in the order of queries."""
+    # All workers share one session; more workers than it pools connections for
+    # would open connections that are discarded after each request
+    from background_request import POOL_MAXSIZE
+
+    with ThreadPoolExecutor(max_workers=min(max(1, pool_size), POOL_MAXSIZE)) as executor:
+        return list(executor.map(lambda query: validate_query(query, auth), queries))
+
+# Last successful record in a query's stored performance metadata, if any
+def last_successful(performance: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not performance:
+        return None
+    if performance.get('status') == 'ok':
+        return {key: value for key, value in performance.items() if key != 'last_ok'}
+    return performance.get('last_ok')
+
+def update_performance(previous: Optional[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Performance metadata to store after a run: the new record. A failed run
+    (e.g. an outage) keeps the last successful record under 'last_ok', so it
+    does not replace the baseline regressions are measured against.
+    """
+    baseline = last_successful(previous)
+    if record['status'] == 'ok' or baseline is None:
+        return dict(record)
+    return {**record, 'last_ok': baseline}
+
+def find_regressions(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> List[str]:
+    """Compare a new performance record with the last successful one stored for the query."""
+    baseline = last_successful(previous)
+    if not baseline:
+        return []
+
+    if current['status'] != 'ok':
+        return ["failing"]
+
+    regressions = []
+    baseline_ms = baseline.get('runtime_ms')
+    if baseline_ms is not None:
+        if current['runtime_ms'] > baseline_ms * SLOWDOWN_FACTOR and current['runtime_ms'] - baseline_ms >= MIN_SLOWDOWN_MS:
+            regressions.append("slower")
+
+    if baseline.get('result_checksum') and baseline['result_checksum'] != current['result_checksum']:
+        regressions.append("changed results")
+
+    return regressions
\ No newline at end of file
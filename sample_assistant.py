@@ -1,24 +1,42 @@
 import streamlit as st
-import requests
-import pandas as pd
-import yaml
-import json
 import os
-import base64
-from typing import Dict, Any, Tuple, List, Optional
+from typing import Dict, Any, Tuple, List, Optional, Union, TYPE_CHECKING
 from datetime import datetime
 
-# Import LangChain components
-from langchain.llms import OpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+# Streamlit re-runs this script on every interaction, so heavy dependencies
+# (LangChain, pandas, requests, yaml, pyarrow) are imported inside the code
+# paths that need them instead of here.
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+    import requests
+    from background_request import BackgroundRequest
+
+from vql_client import with_query_timeout, RESULT_ROW_LIMIT, QUERY_TIMEOUT_SECONDS
+from session_manager import get_session, cache_partition
+from snapshot_store import snapshots_available, load_snapshot, save_snapshot, snapshot_age
+from query_guard import check_query, expected_runtime, record_runtime
+from query_matcher import (
+    MATCH_SIMILARITY_THRESHOLD, MODIFICATION_SIMILARITY_THRESHOLD, MATCH_PROMPT_TEMPLATE,
+    MATCH_REPAIR_TEMPLATE, ADJUST_SQL_TEMPLATE, format_verified_queries, parse_match_response
+)
 
 # Configuration
 YAML_FILE_PATH = "verified_queries.yaml"
 DENODO_AI_SDK_ENDPOINT = "http://localhost:8008/answerDataQuestion"
-DENODO_CATALOG_ENDPOINT = "http://localhost:39090/denodo-data-catalog/public/api/askaquestion/execute"
-SERVER_ID = 1
-VERIFY_SSL = False
+# Data Catalog endpoint, row limit and query timeout are configured in vql_client.py
+# Deadline for AI SDK answers, which include SQL generation and execution
+AI_SDK_TIMEOUT_SECONDS = 300
+
+# Start the AI SDK request in the background while the matcher runs, so a
+# rejected match does not have to wait for the fallback from scratch. Off by
+# default: every prefetch is a full AI SDK answer (SQL generation and a Denodo
+# execution) that is wasted when the match is accepted, and aborting it only
+# closes the socket; the AI SDK has no server-side cancel.
+AI_SDK_PREFETCH = False
+# Serve unmodified verified queries from their result snapshot when it is younger
+# than this; a verified query can override it with a 'snapshot_max_age' key.
+SNAPSHOT_MAX_AGE_SECONDS = 24 * 60 * 60
 
 # Set up page configuration
 st.set_page_config(page_title="Smart Query Assistant", layout="wide")
@@ -64,6 +82,14 @@ st.markdown("""
         font-size: 0.8em;
         margin-right: 10px;
     }
+    .refine-tag {
+        background-color: #6699cc;
+        color: white;
+        padding: 3px 6px;
+        border-radius: 3px;
+        font-size: 0.8em;
+        margin-right: 10px;
+    }
     .match-tag {
         background-color: #99cc99;
         color: white;
@@ -90,66 +116,81 @@ if 'denodo_username' not in st.session_state:
     st.session_state.denodo_username = "admin"
 if 'denodo_password' not in st.session_state:
     st.session_state.denodo_password = "admin"
+if 'match_threshold' not in st.session_state:
+    st.session_state.match_threshold = MATCH_SIMILARITY_THRESHOLD
+if 'modification_threshold' not in st.session_state:
+    st.session_state.modification_threshold = MODIFICATION_SIMILARITY_THRESHOLD
+if 'last_result' not in st.session_state:
+    # Last displayed result, used to answer follow-up questions locally
+    st.session_state.last_result = None
+
+# Parse the verified queries file; cached across reruns until the file changes
+@st.cache_data(show_spinner=False)
+def _parse_verified_queries(path: str, mtime: float) -> List[Dict[str, Any]]:
+    import yaml
+    with open(path, 'r') as file:
+        data = yaml.safe_load(file)
+    return data.get('verified_queries', []) if data else []
 
 # Load verified queries from YAML
 def load_verified_queries():
+    import yaml
     if os.path.exists(YAML_FILE_PATH):
-        with open(YAML_FILE_PATH, 'r') as file:
-            try:
-                data = yaml.safe_load(file)
-                return data.get('verified_queries', []) if data else []
-            except yaml.YAMLError:
-                st.error(f"Error parsing YAML file: {YAML_FILE_PATH}")
-                return []
+        try:
+            return _parse_verified_queries(YAML_FILE_PATH, os.path.getmtime(YAML_FILE_PATH))
+        except yaml.YAMLError:
+            st.error(f"Error parsing YAML file: {YAML_FILE_PATH}")
+            return []
     return []
 
+# LLM client, shared across reruns and sessions using the same API key
+@st.cache_resource(show_spinner=False)
+def get_llm(api_key: str):
+    from langchain.llms import OpenAI
+    return OpenAI(temperature=0, api_key=api_key)
+
+# Build a LangChain chain for a prompt template; LangChain is imported on first use
+def build_chain(template: str, input_variables: List[str]):
+    from langchain.prompts import PromptTemplate
+    from langchain.chains import LLMChain
+    prompt = PromptTemplate(input_variables=input_variables, template=template)
+    return LLMChain(llm=get_llm(st.session_state.openai_api_key), prompt=prompt)
+
 # Execute VQL function
-def execute_vql(vql: str, limit: int = 1000) -> Tuple[int, Dict[str, Any]]:
+def execute_vql(vql: str, limit: int = RESULT_ROW_LIMIT) -> Tuple[int, Dict[str, Any]]:
     """
-    Execute VQL against Data Catalog with support for various authentication methods.
+    Execute VQL against Data Catalog in a worker thread, showing elapsed time
+    and a Cancel button. The query is aborted after QUERY_TIMEOUT_SECONDS.
     """
-    execution_url = DENODO_CATALOG_ENDPOINT
-    server_id = SERVER_ID
-    verify_ssl = VERIFY_SSL
-    auth = (st.session_state.denodo_username, st.session_state.denodo_password)
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
+    import requests
+    from vql_client import post_vql
+    from background_request import BackgroundRequest, RequestCancelled, wait_for_request
     
-    # Calculate basic auth header
-    if isinstance(auth, tuple):
-        username, password = auth
-        auth_string = f"{username}:{password}"
-        encoded_auth = base64.b64encode(auth_string.encode('utf-8')).decode('utf-8')
-        headers['Authorization'] = f'Basic {encoded_auth}'
+    auth = (st.session_state.denodo_username, st.session_state.denodo_password)
+    timed_vql = with_query_timeout(vql, QUERY_TIMEOUT_SECONDS)
     
-    data = {
-        "vql": vql,
-        "limit": limit
-    }
+    st.write("Debug - Executing VQL:", timed_vql)  # Debug log
     
-    st.write("Debug - Executing VQL:", vql)  # Debug log
+    request = BackgroundRequest(post_vql, timed_vql, auth, limit, timeout=QUERY_TIMEOUT_SECONDS, session=get_session(*auth))
+    wait_for_request(request, "Executing query...")
     
     try:
-        response = requests.post(
-            f"{execution_url}?serverId={server_id}",
-            json=data,
-            headers=headers,
-            verify=verify_ssl
-        )
-        response.raise_for_status()
+        result = request.result()
+        st.write("Debug - API Response:", result)  # Debug log
         
-        json_response = response.json()
-        st.write("Debug - API Response:", json_response)  # Debug log
+        # Runtime history for the query guard
+        record_runtime(vql, round(request.elapsed() * 1000))
         
         # Return the full response even if no rows
-        return 200, {
-            "rows": json_response.get('rows', []),
-            "columnNames": json_response.get('columnNames', [])
-        }
+        return 200, result
         
+    except RequestCancelled as e:
+        if request.timed_out:
+            # It ran at least this long, so the guard limits or blocks it next time
+            record_runtime(vql, QUERY_TIMEOUT_SECONDS * 1000)
+        error_msg = f"Query stopped: {str(e)}"
+        st.warning(error_msg)
+        return (408 if request.timed_out else 499), {"error": error_msg}
     except requests.HTTPError as e:
         error_msg = f"Data Catalog API error: {str(e)}"
         st.error(error_msg)
@@ -163,12 +204,14 @@ def execute_vql(vql: str, limit: int = 1000) -> Tuple[int, Dict[str, Any]]:
         st.error(error_msg)
         return 500, {"error": error_msg}
 
-def display_query_results(status_code: int, result: Dict[str, Any], sql: str):
-    """Helper function to display query results in Streamlit"""
+def display_query_results(status_code: int, result: Dict[str, Any], sql: str) -> Optional["pd.DataFrame"]:
+    """Helper function to display query results in Streamlit. Returns the displayed DataFrame."""
+    import pandas as pd
+    
     if (status_code == 200):
         if "error" in result:
             st.error(result["error"])
-            return
+            return None
         
         # Display SQL query first
         st.subheader("Executed SQL Query")
@@ -204,6 +247,7 @@ def display_query_results(status_code: int, result: Dict[str, Any], sql: str):
                     
                     # Display raw values for debugging
                     st.write("Debug - Data:", rows_data)
+                    return df
                 else:
                     st.info("Query executed but no data was returned")
                     st.write("Debug - Raw Response:", result)
@@ -216,6 +260,42 @@ def display_query_results(status_code: int, result: Dict[str, Any], sql: str):
     else:
         st.error(f"Query execution failed with status code {status_code}")
         st.write("Debug - Error Details:", result.get('error', 'Unknown error'))
+    return None
+
+def display_snapshot_results(snapshot: Dict[str, Any], sql: str) -> "pa.Table":
+    """Display the last known result of a verified query from its snapshot. Returns the displayed Arrow table."""
+    st.subheader("Executed SQL Query")
+    st.code(sql, language="sql")
+    
+    st.subheader("Query Results")
+    st.caption(f"Snapshot refreshed at {snapshot['refreshed_at'].strftime('%d %B %Y %H:%M')}")
+    # Displayed straight from the memory-mapped table, without a pandas copy
+    table = snapshot["table"]
+    st.dataframe(table, use_container_width=True)
+    st.success(f"Found {snapshot['row_count']} rows")
+    return table
+
+# Cache partition of the current Denodo principal; None until Denodo has accepted its credentials
+def current_partition() -> Optional[str]:
+    return cache_partition(st.session_state.denodo_username, st.session_state.denodo_password)
+
+# Remember the displayed result so follow-up questions can be answered locally.
+# Snapshot results stay Arrow tables until a follow-up actually needs pandas.
+def remember_result(question: str, sql: str, df: Union["pd.DataFrame", "pa.Table", None], derived: bool = False):
+    partition = current_partition()
+    if df is None or len(df) == 0 or partition is None:
+        st.session_state.last_result = None
+        return
+    st.session_state.last_result = {
+        # Only the principal that fetched the rows may refine them
+        "partition": partition,
+        "question": question,
+        "sql": sql,
+        "df": df,
+        # Rows beyond the fetch limit are missing, and a derived (refined) result is
+        # not the full result of its SQL, so local answers from either would be wrong
+        "complete": not derived and len(df) < RESULT_ROW_LIMIT
+    }
 
 # Parse execution JSON
 def parse_execution_json(json_response: Dict[str, Any]) -> Dict[str, Any]:
@@ -240,10 +320,12 @@ def parse_execution_json(json_response: Dict[str, Any]) -> Dict[str, Any]:
     return execution_result
 
 # Convert execution result to DataFrame
-def execution_result_to_df(execution_result: Dict[str, Any]) -> pd.DataFrame:
+def execution_result_to_df(execution_result: Dict[str, Any]) -> "pd.DataFrame":
     """
     Convert the execution result dictionary to a pandas DataFrame.
     """
+    import pandas as pd
+    
     if not execution_result:
         return pd.DataFrame()
     
@@ -266,190 +348,159 @@ def find_matching_query(question: str, verified_queries: List[Dict[str, Any]]) -
     if not verified_queries or not st.session_state.openai_api_key:
         return None
 
-    # Create a string representation of all verified queries
-    queries_str = ""
-    for i, query in enumerate(verified_queries):
-        queries_str += f"Query {i+1}:\n"
-        queries_str += f"Name: {query.get('name', '')}\n"
-        queries_str += f"Question: {query.get('question', '')}\n"
-        queries_str += f"SQL: {query.get('sql', '')}\n"
-        queries_str += f"Explanation: {query.get('query_explanation', '')}\n\n"
-    
-    # Updated template for strict JSON formatting
-    template_str = """You are an expert at matching user questions with verified SQL queries.
-Your task is to analyze the user's question and find the most similar verified query.
-
-Follow these comparison rules carefully:
-1. Core Query Components:
-   - What is being counted/summed/averaged?
-   - Which time period is being queried?
-   - What status or category filters are needed?
-
-2. Pattern Matching:
-   - Match main action (count, sum, etc.)
-   - Match time period (specific year)
-   - Match status (delivered, canceled, shipped, etc.)
-   - Look for status values in SQL comments
-
-3. Modification Requirements:
-   - List ALL required changes in modifications
-   - Include both year AND status changes when needed
-   - Be explicit about which status value to use
-   - Use values from SQL comments when available
-
-Output a SINGLE LINE JSON:
-{{"match":boolean,"query_number":number,"similarity":number,"modification_needed":boolean,"modifications":string}}
-
-Example modifications:
-- Multiple changes: {{"match":true,"query_number":1,"similarity":95,"modification_needed":true,"modifications":"Change year from 2018 to 2017 in WHERE clause AND update order_status from 'canceled' to 'shipped' (value from comment)"}}
-- Status only: {{"match":true,"query_number":1,"similarity":90,"modification_needed":true,"modifications":"Update order_status from 'delivered' to 'shipped' using value from comment"}}
-- Year only: {{"match":true,"query_number":1,"similarity":85,"modification_needed":true,"modifications":"Change year from 2018 to 2017 in WHERE clause"}}
-
-User Question: {question}
-
-Previously verified queries:
-{verified_queries}
-
-Output JSON:"""
-
-    # Create prompt template
-    prompt = PromptTemplate(
-        input_variables=["question", "verified_queries"],
-        template=template_str
-    )
-
     # Create LLMChain with lower temperature for consistent output
-    llm = OpenAI(temperature=0, api_key=st.session_state.openai_api_key)
-    chain = LLMChain(llm=llm, prompt=prompt)
+    chain = build_chain(MATCH_PROMPT_TEMPLATE, ["question", "verified_queries"])
     
     try:
         with st.spinner("Checking for similar queries..."):
             # Get raw response and clean it
-            response = chain.run(question=question, verified_queries=queries_str)
-            response = response.strip().strip('"\'')
+            response = chain.run(question=question, verified_queries=format_verified_queries(verified_queries))
             
             # Debug logging
             st.write("Debug - Raw LLM response:", response)
             
             try:
-                # Parse the cleaned response
-                response_json = json.loads(response)
-                
-                # Validate response format
-                required_keys = {"match", "query_number", "similarity", "modification_needed", "modifications"}
-                if not all(key in response_json for key in required_keys):
-                    st.error(f"Missing required keys in response. Found keys: {list(response_json.keys())}")
+                response_json = parse_match_response(response, len(verified_queries))
+            except ValueError as e:
+                # Give the LLM a single chance to repair its output
+                st.write("Debug - Invalid matcher response, retrying:", str(e))
+                repair_chain = build_chain(MATCH_REPAIR_TEMPLATE, ["error", "response"])
+                response = repair_chain.run(error=str(e), response=response)
+                st.write("Debug - Repaired LLM response:", response)
+                try:
+                    response_json = parse_match_response(response, len(verified_queries))
+                except ValueError as e:
+                    st.error(f"Failed to parse matcher response: {str(e)}")
+                    st.text(f"Raw response: {response}")
                     return None
-                
-                if not response_json["match"]:
-                    return None
-                
-                query_number = int(response_json["query_number"])
-                if not (0 < query_number <= len(verified_queries)):
-                    st.error(f"Invalid query number: {query_number}")
-                    return None
-                
-                return {
-                    "verified_query": verified_queries[query_number - 1],
-                    "similarity": response_json["similarity"],
-                    "modification_needed": response_json["modification_needed"],
-                    "modifications": response_json["modifications"]
-                }
-                
-            except json.JSONDecodeError as e:
-                st.error(f"Failed to parse JSON response: {str(e)}")
-                st.text(f"Raw response: {response}")
+            
+            if not response_json["match"]:
+                return None
+            
+            query_number = response_json["query_number"]
+            
+            # Reject low-confidence matches before they reach adjust_sql/execute_vql
+            similarity = response_json["similarity"]
+            if response_json["modification_needed"]:
+                threshold = st.session_state.modification_threshold
+            else:
+                threshold = st.session_state.match_threshold
+            if similarity < threshold:
+                st.info(f"Closest verified query has similarity {similarity:g}, below the threshold of {threshold}.")
                 return None
+            
+            return {
+                "verified_query": verified_queries[query_number - 1],
+                "similarity": similarity,
+                "modification_needed": response_json["modification_needed"],
+                "modifications": response_json["modifications"]
+            }
                 
     except Exception as e:
         st.error(f"Error while checking for query matches: {str(e)}")
         return None
 
+# Send a question to the Denodo AI SDK (safe to call from a worker thread)
+def _post_ai_sdk_question(question: str, auth: Tuple[str, str], session: Optional["requests.Session"] = None,
+                          timeout: float = AI_SDK_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    import requests
+    
+    payload = {
+        "question": question,
+        "mode": "data",
+        "verbose": True
+    }
+    
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+    
+    # Make the request to the Denodo AI SDK API
+    response = (session or requests).post(DENODO_AI_SDK_ENDPOINT, json=payload, headers=headers, auth=auth, timeout=timeout)
+    response.raise_for_status()
+    
+    return response.json()
+
 # Function to query Denodo AI SDK
 def query_denodo_ai_sdk(question: str) -> Dict[str, Any]:
     """
     Query the Denodo AI SDK with the given question.
     """
+    return collect_ai_sdk_result(start_ai_sdk_request(question))
+
+# Start the AI SDK request in a worker thread, e.g. while matching runs
+def start_ai_sdk_request(question: str) -> "BackgroundRequest":
+    """
+    Submit the AI SDK request to a worker thread and return its handle.
+    Streamlit state is read here, on the script thread, not in the worker.
+    """
+    from background_request import BackgroundRequest
+    
+    auth = (st.session_state.denodo_username, st.session_state.denodo_password)
+    return BackgroundRequest(_post_ai_sdk_question, question, auth, timeout=AI_SDK_TIMEOUT_SECONDS, session=get_session(*auth))
+
+# Wait for an AI SDK request started by start_ai_sdk_request
+def collect_ai_sdk_result(request: "BackgroundRequest") -> Dict[str, Any]:
+    import requests
+    from background_request import RequestCancelled, wait_for_request
+    
+    wait_for_request(request, "Generating answer with AI SDK...")
     try:
-        # Prepare the request
-        payload = {
-            "question": question,
-            "mode": "data",
-            "verbose": True
-        }
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
-        # Basic authentication credentials
-        auth = (st.session_state.denodo_username, st.session_state.denodo_password)
-        
-        # Make the request to the Denodo AI SDK API
-        with st.spinner("Generating answer with AI SDK..."):
-            response = requests.post(DENODO_AI_SDK_ENDPOINT, json=payload, headers=headers, auth=auth)
-            response.raise_for_status()
-            
-            return response.json()
+        return request.result()
+    except RequestCancelled as e:
+        st.warning(f"AI SDK request stopped: {str(e)}")
+        return {}
     except requests.exceptions.RequestException as e:
         st.error(f"Error connecting to Denodo AI SDK: {str(e)}")
         return {}
 
+# Function to answer a follow-up question from the previous result
+def refine_last_result(question: str, last_result: Dict[str, Any]) -> Optional["pd.DataFrame"]:
+    """
+    Ask the LLM for a refinement plan (filters, sorts, top-N, re-aggregation)
+    over the previous result and apply it locally with pandas. Returns None
+    when the question needs data the previous result does not hold.
+    """
+    import pandas as pd
+    from result_refiner import REFINEMENT_TEMPLATE, looks_like_refinement, describe_columns, parse_refinement_plan, apply_refinement
+    
+    if not last_result["complete"] or not st.session_state.openai_api_key or not looks_like_refinement(question):
+        return None
+    
+    df = last_result["df"]
+    if not isinstance(df, pd.DataFrame):
+        df = df.to_pandas()
+    chain = build_chain(REFINEMENT_TEMPLATE, ["previous_question", "previous_sql", "columns", "question"])
+    
+    try:
+        with st.spinner("Checking if the previous result can answer this..."):
+            response = chain.run(
+                previous_question=last_result["question"],
+                previous_sql=last_result["sql"],
+                columns=describe_columns(df),
+                question=question
+            )
+            st.write("Debug - Raw refinement plan:", response)
+            
+            plan = parse_refinement_plan(response, df)
+            if not plan["local"]:
+                return None
+            
+            return apply_refinement(df, plan)
+    except Exception as e:
+        # Anything the local engine cannot handle goes down the remote path
+        st.write("Debug - Local refinement not possible:", str(e))
+        return None
+
 # Function to adjust SQL based on modifications from the LLM
 def adjust_sql(original_sql: str, modifications: str) -> str:
     """Use LangChain to adjust SQL based on the modifications."""
     if not modifications or not st.session_state.openai_api_key:
         return original_sql
     
-    template = """
-    You are an expert SQL developer. Your task is to analyze and modify SQL based on user requirements.
-
-    Original SQL:
-    {original_sql}
-    
-    Modification instructions:
-    {modifications}
-    
-    Rules:
-    1. Analyze ALL Components:
-       - Column aliases: Update to match the context (e.g., "Products Delivered" → "Products Shipped")
-       - SQL Comments: Extract valid status values
-       - WHERE conditions: Year and status filters
-    
-    2. ONLY modify these parts:
-       - Column aliases in SELECT clause to match the question context
-       - Year in BETWEEN clause as requested
-       - Status values using options from comments
-    
-    3. Column Alias Guidelines:
-       - Match the verb from user's question (delivered → shipped)
-       - Keep "Number of" prefix if present
-       - Maintain quote style and capitalization
-       - Example: "Number of Products Delivered" → "Number of Products Shipped"
-    
-    4. Keep Intact:
-       - Query structure
-       - Table names
-       - Aggregation functions
-       - Comment content
-    
-    Example:
-    User asks "how many orders shipped in 2017":
-    Original: SELECT COUNT(*) AS "Number of Products Delivered"
-    Modified: SELECT COUNT(*) AS "Number of Products Shipped"
-
-    Return complete SQL with both alias and condition changes.
-    """
-    
-    prompt = PromptTemplate(
-        input_variables=["original_sql", "modifications"],
-        template=template
-    )
-    
     # Create LLMChain
-    llm = OpenAI(temperature=0, api_key=st.session_state.openai_api_key)
-    chain = LLMChain(llm=llm, prompt=prompt)
+    chain = build_chain(ADJUST_SQL_TEMPLATE, ["original_sql", "modifications"])
     
     try:
         with st.spinner("Adjusting SQL query..."):
@@ -476,6 +527,11 @@ with st.sidebar:
     st.session_state.denodo_username = st.text_input("Denodo Username", value=st.session_state.denodo_username)
     st.session_state.denodo_password = st.text_input("Denodo Password", value=st.session_state.denodo_password, type="password")
     
+    # Matching thresholds
+    st.header("Matching")
+    st.session_state.match_threshold = st.slider("Minimum similarity for a match", 0, 100, value=st.session_state.match_threshold)
+    st.session_state.modification_threshold = st.slider("Minimum similarity for a modified match", 0, 100, value=st.session_state.modification_threshold)
+    
     # History
     st.header("Query History")
     if st.session_state.history:
@@ -503,12 +559,35 @@ if st.button("Submit") and question:
     # Load verified queries
     verified_queries = load_verified_queries()
     
+    # Try to answer follow-up questions from the previous result first
+    refined_df = None
+    last_result = st.session_state.last_result
+    if last_result and last_result["partition"] != current_partition():
+        last_result = None
+    if last_result:
+        refined_df = refine_last_result(question, last_result)
+    
     # Check if the question matches any verified query
     match_info = None
-    if verified_queries and st.session_state.openai_api_key:
+    ai_sdk_request = None
+    if refined_df is None and verified_queries and st.session_state.openai_api_key:
+        if AI_SDK_PREFETCH:
+            ai_sdk_request = start_ai_sdk_request(question)
         match_info = find_matching_query(question, verified_queries)
     
-    if match_info:
+    if refined_df is not None:
+        st.markdown(f"<span class='refine-tag'>PREVIOUS RESULT</span> Answered from the result of: '{last_result['question']}'", unsafe_allow_html=True)
+        
+        st.subheader("Query Results")
+        st.dataframe(refined_df, use_container_width=True)
+        st.success(f"Found {len(refined_df)} rows")
+        
+        remember_result(question, last_result["sql"], refined_df, derived=True)
+    elif match_info:
+        if ai_sdk_request:
+            # Not needed anymore; close its connection (the AI SDK may still finish the answer)
+            ai_sdk_request.cancel()
+        
         verified_query = match_info["verified_query"]
         st.markdown(f"<span class='match-tag'>MATCHED QUERY</span> Found a similar verified query: '{verified_query.get('name')}'", unsafe_allow_html=True)
         
@@ -517,6 +596,7 @@ if st.button("Submit") and question:
         
         # Get the SQL from the verified query
         sql = verified_query.get("sql", "")
+        verified_sql = sql
         
         # Check if modifications are needed
         if match_info.get("modification_needed", False):
@@ -538,9 +618,50 @@ if st.button("Submit") and question:
             st.subheader("SQL Query")
             st.markdown(f"<div class='query-box'>{sql}</div>", unsafe_allow_html=True)
         
-        # Execute the query and display results
-        status_code, result = execute_vql(sql)
-        display_query_results(status_code, result, sql)
+        # Answer from the result snapshot when the verified SQL is used unchanged.
+        # No Denodo call is made then, so only principals Denodo has already
+        # accepted may read their partition; others execute the query first.
+        snapshot = None
+        partition = current_partition()
+        if sql == verified_sql and snapshots_available() and partition is not None:
+            try:
+                snapshot = load_snapshot(verified_query.get("name", ""), sql, partition)
+            except Exception as e:
+                st.warning(f"Could not read result snapshot: {str(e)}")
+            max_age = verified_query.get("snapshot_max_age", SNAPSHOT_MAX_AGE_SECONDS)
+            if snapshot and snapshot_age(snapshot) > max_age:
+                snapshot = None
+        
+        if snapshot:
+            df = display_snapshot_results(snapshot, sql)
+        else:
+            # Guard the shared server against slow or unbounded queries; without a
+            # recorded run of this shape, the verified query's runtime is the estimate
+            guard = check_query(sql, expected_runtime(sql, verified_query))
+            if guard["expected_runtime_ms"] is not None:
+                st.caption(f"Expected runtime: {guard['expected_runtime_ms'] / 1000:.1f}s")
+            
+            if guard["action"] == "block":
+                st.error(f"Query blocked: {guard['reason']}.")
+                df = None
+            else:
+                if guard["action"] == "limit":
+                    st.warning(f"Added a row limit to the query: {guard['reason']}.")
+                    sql = guard["sql"]
+                
+                # Execute the query and display results
+                status_code, result = execute_vql(sql)
+                df = display_query_results(status_code, result, sql)
+            
+            # Refresh the snapshot of the verified query
+            partition = current_partition()
+            if df is not None and sql == verified_sql and snapshots_available() and partition is not None:
+                try:
+                    save_snapshot(verified_query.get("name", ""), sql, df, partition)
+                except Exception as e:
+                    st.warning(f"Could not save result snapshot: {str(e)}")
+        
+        remember_result(question, sql, df)
         
         # Display explanation
         if verified_query.get("query_explanation"):
@@ -550,8 +671,11 @@ if st.button("Submit") and question:
         # If no match is found, use the Denodo AI SDK
         st.markdown("<span class='source-tag'>AI SDK</span> No matching verified query found. Using AI to generate an answer.", unsafe_allow_html=True)
         
-        # Query the Denodo AI SDK
-        ai_result = query_denodo_ai_sdk(question)
+        # Query the Denodo AI SDK, reusing the request started before matching
+        if ai_sdk_request:
+            ai_result = collect_ai_sdk_result(ai_sdk_request)
+        else:
+            ai_result = query_denodo_ai_sdk(question)
         
         if ai_result:
             # Display the AI's answer   
@@ -573,6 +697,7 @@ if st.button("Submit") and question:
             execution_result = ai_result.get('execution_result', {})
             df = execution_result_to_df(execution_result)
             st.dataframe(df, use_container_width=True)
+            remember_result(question, ai_result.get('sql_query', ''), df)
             
             # Display any related questions suggested by the AI
             related_questions = ai_result.get('related_questions', [])
@@ -0,0 +1,81 @@
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Tuple, Optional, TYPE_CHECKING
+
+# requests is imported with the first session, not when the apps start
+if TYPE_CHECKING:
+    import requests
+
+# Sessions unused for this long are closed and dropped from the pool
+SESSION_IDLE_SECONDS = 15 * 60
+
+# Row-level security role of each Denodo user. Users mapped to the same role see
+# the same rows, so they share cached results; unmapped users get a private partition.
+USER_ROLES: Dict[str, str] = {}
+
+# One authenticated session per principal, shared by all reruns and worker threads.
+# A principal is "accepted" once Denodo answered one of its requests with a 2xx.
+_sessions: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+# Sessions are keyed by a hash of the credentials so a changed password gets a new session
+def _principal_key(username: str, password: str) -> Tuple[str, str]:
+    return username, hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+def evict_idle_sessions() -> int:
+    """Close sessions that have been idle longer than SESSION_IDLE_SECONDS."""
+    now = time.monotonic()
+    with _lock:
+        idle = [key for key, entry in _sessions.items() if now - entry["last_used"] > SESSION_IDLE_SECONDS]
+        evicted = [_sessions.pop(key) for key in idle]
+    for entry in evicted:
+        entry["session"].close()
+    return len(evicted)
+
+# Response hook recording whether Denodo accepted the principal's credentials
+def _track_acceptance(entry: Dict[str, Any]):
+    def hook(response, *args, **kwargs):
+        if 200 <= response.status_code < 300:
+            entry["accepted"] = True
+        elif response.status_code in (401, 403):
+            entry["accepted"] = False
+        return response
+    return hook
+
+def get_session(username: str, password: str) -> "requests.Session":
+    """
+    Return the pooled session of a Denodo principal, creating it on first use.
+    The session keeps its connections and cookies alive between requests.
+    """
+    from background_request import new_session
+
+    evict_idle_sessions()
+    key = _principal_key(username, password)
+    with _lock:
+        entry = _sessions.get(key)
+        if entry is None:
+            session = new_session()
+            session.auth = (username, password)
+            entry = {"session": session, "accepted": False}
+            session.hooks["response"].append(_track_acceptance(entry))
+            _sessions[key] = entry
+        entry["last_used"] = time.monotonic()
+        return entry["session"]
+
+def is_accepted(username: str, password: str) -> bool:
+    """True if Denodo has accepted these credentials in a request of their pooled session."""
+    with _lock:
+        entry = _sessions.get(_principal_key(username, password))
+        return bool(entry and entry["accepted"])
+
+def cache_partition(username: str, password: str) -> Optional[str]:
+    """
+    Name of the cache partition a principal may read from and write to, or
+    None until Denodo has accepted its credentials. The username alone is
+    typed by the user and proves nothing.
+    """
+    if not is_accepted(username, password):
+        return None
+    role = USER_ROLES.get(username)
+    return f"role-{role}" if role else f"user-{username}"
\ No newline at end of file
@@ -0,0 +1,116 @@
+import os
+import re
+import hashlib
+import importlib.util
+from typing import Dict, Any, Optional, TYPE_CHECKING
+from datetime import datetime
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+# Configuration
+SNAPSHOT_DIR = "snapshots"
+# Arrow IPC buffer compression: None, "lz4" or "zstd". Uncompressed snapshots are
+# read zero-copy from the memory map; compressed ones trade that for disk space.
+SNAPSHOT_COMPRESSION = None
+
+# pyarrow is optional and imported only when a snapshot is read or written
+_PYARROW_INSTALLED = importlib.util.find_spec("pyarrow") is not None
+
+def snapshots_available() -> bool:
+    """Return True if pyarrow is installed and snapshots can be used."""
+    return _PYARROW_INSTALLED
+
+# Hash of the SQL a snapshot was produced from
+def sql_hash(sql: str) -> str:
+    return hashlib.sha256(sql.strip().encode('utf-8')).hexdigest()
+
+def _slug(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', value).strip('_').lower()
+
+# Directory of a cache partition. Hashed, since slugs of different principals
+# can collide ("user-john.doe" and "user-john_doe") and would share a cache.
+def _partition_dir(partition: str) -> str:
+    return hashlib.sha256(partition.encode('utf-8')).hexdigest()
+
+# File path of the snapshot of a verified query's SQL in a cache partition. Names
+# are not unique, so the SQL hash is part of the file name.
+def snapshot_path(name: str, sql: str, partition: str) -> str:
+    filename = f"{_slug(name) or 'query'}-{sql_hash(sql)[:16]}.arrow"
+    return os.path.join(SNAPSHOT_DIR, _partition_dir(partition), filename)
+
+def save_snapshot(name: str, sql: str, df: "pd.DataFrame", partition: str) -> Dict[str, Any]:
+    """
+    Materialize a verified query's result as an Arrow IPC file, recording the
+    refresh time and the hash of the source SQL in the schema metadata.
+    Snapshots are stored per cache partition so row-level security is kept.
+    """
+    if not snapshots_available():
+        raise RuntimeError("pyarrow is required for result snapshots")
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns with mixed value types are stored as text
+        table = pa.Table.from_pandas(df.astype(str), preserve_index=False)
+
+    refreshed_at = datetime.now()
+    table = table.replace_schema_metadata({
+        "name": name,
+        "sql_hash": sql_hash(sql),
+        "refreshed_at": refreshed_at.isoformat(timespec="seconds")
+    })
+
+    path = snapshot_path(name, sql, partition)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    options = ipc.IpcWriteOptions(compression=SNAPSHOT_COMPRESSION)
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    return {
+        "path": path,
+        "refreshed_at": refreshed_at,
+        "sql_hash": sql_hash(sql),
+        "row_count": table.num_rows
+    }
+
+def load_snapshot(name: str, sql: str, partition: str) -> Optional[Dict[str, Any]]:
+    """
+    Memory-map the snapshot of a verified query and return it as an Arrow
+    table. Returns None if there is no snapshot or it was produced from
+    different SQL.
+    """
+    if not snapshots_available():
+        return None
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    path = snapshot_path(name, sql, partition)
+    if not os.path.exists(path):
+        return None
+
+    # The table's buffers point into the memory map, so nothing is copied. The
+    # file handle is closed on return; the mapping itself stays alive as long as
+    # the table's buffers reference it and is released with the table.
+    with pa.memory_map(path, 'r') as source:
+        table = ipc.open_file(source).read_all()
+    metadata = {k.decode('utf-8'): v.decode('utf-8') for k, v in (table.schema.metadata or {}).items()}
+    if metadata.get("sql_hash") != sql_hash(sql):
+        return None
+
+    return {
+        "table": table,
+        "refreshed_at": datetime.fromisoformat(metadata["refreshed_at"]),
+        "sql_hash": metadata["sql_hash"],
+        "row_count": table.num_rows
+    }
+
+# Age of a loaded snapshot in seconds
+def snapshot_age(snapshot: Dict[str, Any]) -> float:
+    return (datetime.now() - snapshot["refreshed_at"]).total_seconds()
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Measure cold-start and per-rerun overhead of the Streamlit apps.
+
+Each app runs in a fresh interpreter with Streamlit's AppTest, so the first
+run pays for every import the script triggers and later runs show what each
+interaction costs. It also reports which heavy dependencies a plain page load
+imported, which should be none of them.
+
+    python startup_benchmark.py [--reruns 10] [--output startup_benchmark.json]
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+APPS = ["sample_assistant.py", "SqlValidator.py"]
+HEAVY_MODULES = ["langchain", "pandas", "requests", "yaml", "pyarrow"]
+
+# Runs inside the child interpreter
+def measure_app(app: str, reruns: int) -> dict:
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_import = time.perf_counter() - start
+
+    at = AppTest.from_file(app, default_timeout=120)
+    start = time.perf_counter()
+    at.run()
+    cold_run = time.perf_counter() - start
+
+    rerun_times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        rerun_times.append(time.perf_counter() - start)
+
+    return {
+        "app": app,
+        "streamlit_import_ms": round(streamlit_import * 1000, 1),
+        "cold_run_ms": round(cold_run * 1000, 1),
+        "rerun_median_ms": round(statistics.median(rerun_times) * 1000, 1) if rerun_times else None,
+        "rerun_max_ms": round(max(rerun_times) * 1000, 1) if rerun_times else None,
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        "exceptions": [str(e.value) for e in at.exception]
+    }
+
+def run_child(app: str, reruns: int) -> dict:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, __file__, "--child", app, "--reruns", str(reruns)],
+        capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    # Includes interpreter start-up, as a user's first page load would
+    result["process_total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=10, help="reruns measured after the cold run")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_app(args.child, args.reruns)))
+        return
+
+    results = [run_child(app, args.reruns) for app in APPS]
+    for result in results:
+        print(f"{result['app']}")
+        print(f"  process total:    {result['process_total_ms']:>8} ms")
+        print(f"  streamlit import: {result['streamlit_import_ms']:>8} ms")
+        print(f"  cold run:         {result['cold_run_ms']:>8} ms")
+        print(f"  rerun median/max: {result['rerun_median_ms']} / {result['rerun_max_ms']} ms")
+        print(f"  heavy modules:    {', '.join(result['heavy_modules_loaded']) or 'none'}")
+        if result["exceptions"]:
+            print(f"  exceptions:       {result['exceptions']}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import query_guard
+from query_guard import add_limit, check_query, expected_runtime, record_runtime, AUTO_LIMIT_ROWS, MAX_EXPECTED_RUNTIME_MS
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM t ORDER BY x",
+    "SELECT * FROM t ORDER BY x;",
+    "SELECT * FROM t ORDER BY x;  -- done",
+    "SELECT * FROM t ORDER BY x /* done */\n",
+])
+def test_limit_is_appended_after_the_statement(sql):
+    assert add_limit(sql, 10) == "SELECT * FROM t ORDER BY x\nLIMIT 10"
+
+def test_unbounded_scan_gets_a_limit():
+    decision = check_query("SELECT * FROM t -- WHERE x = 1")
+    assert decision["action"] == "limit"
+    assert decision["sql"].endswith(f"LIMIT {AUTO_LIMIT_ROWS}")
+
+def test_slow_aggregation_is_blocked():
+    decision = check_query("SELECT COUNT(*) FROM t", MAX_EXPECTED_RUNTIME_MS + 1)
+    assert decision["action"] == "block"
+
+def test_filtered_query_is_allowed():
+    assert check_query("SELECT * FROM t WHERE x = 1;")["action"] == "allow"
+
+@pytest.fixture
+def runtime_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_guard, "RUNTIME_HISTORY_PATH", str(tmp_path / "runtimes.json"))
+
+def validated(runtime_ms, at):
+    return {"performance": {"status": "ok", "runtime_ms": runtime_ms, "validated_at": at.strftime("%d %B %Y %H:%M:%S")}}
+
+def test_expected_runtime_uses_the_same_query_shape(runtime_history):
+    verified = {"performance": {"status": "ok", "runtime_ms": 50}}
+    assert expected_runtime("SELECT * FROM t WHERE y = '2018'", verified) == 50
+
+    record_runtime("SELECT * FROM t WHERE y = '2018'; -- verified", 45000)
+    assert expected_runtime("select *\nFROM t WHERE y = '2017'", verified) == 45000
+    assert expected_runtime("SELECT * FROM t WHERE z = '2017'", verified) == 50
+    assert expected_runtime("SELECT * FROM t WHERE z = '2017'") is None
+
+def test_numeric_literals_share_a_shape(runtime_history):
+    record_runtime("SELECT * FROM t WHERE y = 2018 AND amount > 10.5", 45000)
+    assert expected_runtime("SELECT * FROM t WHERE y = 2017 AND amount > 3") == 45000
+    assert expected_runtime('SELECT * FROM t2 WHERE y = 2017 AND amount > 3') is None
+    # Numbers in quoted identifiers name different columns
+    record_runtime('SELECT "sales 2018" FROM t', 45000)
+    assert expected_runtime('SELECT "sales 2017" FROM t') is None
+
+def test_revalidated_fast_after_a_recorded_timeout_is_allowed(runtime_history):
+    sql = "SELECT COUNT(*) FROM t WHERE y = 2018"
+    record_runtime(sql, 120000)
+    assert check_query(sql, expected_runtime(sql, validated(50, datetime.now() - timedelta(days=1))))["action"] == "block"
+
+    runtime_ms = expected_runtime(sql, validated(50, datetime.now() + timedelta(minutes=1)))
+    assert runtime_ms == 50
+    assert check_query(sql, runtime_ms)["action"] == "allow"
+
+def test_recorded_runtimes_expire(runtime_history, monkeypatch):
+    record_runtime("SELECT COUNT(*) FROM t", 120000)
+    monkeypatch.setattr(query_guard, "RUNTIME_HISTORY_MAX_AGE_SECONDS", -1)
+    assert expected_runtime("SELECT COUNT(*) FROM t") is None
\ No newline at end of file
@@ -0,0 +1,48 @@
+import pytest
+
+from query_matcher import parse_match_response
+
+def test_valid_match():
+    parsed = parse_match_response(
+        'Answer: {"match":true,"query_number":2,"similarity":"92","modification_needed":true,"modifications":"year"}'
+    )
+    assert parsed == {"match": True, "query_number": 2, "similarity": 92.0, "modification_needed": True, "modifications": "year"}
+
+def test_integral_float_query_number_is_accepted():
+    parsed = parse_match_response('{"match":true,"query_number":1.0,"similarity":90,"modification_needed":false,"modifications":null}')
+    assert parsed["query_number"] == 1
+    assert parsed["modifications"] == ""
+
+@pytest.mark.parametrize("response", [
+    '{"match":false,"query_number":null,"similarity":null,"modification_needed":false,"modifications":""}',
+    '{"match":false}',
+])
+def test_no_match_accepts_null_fields(response):
+    parsed = parse_match_response(response)
+    assert parsed["match"] is False
+    assert parsed["query_number"] == 0
+
+@pytest.mark.parametrize("response, message", [
+    ("no json here", "No JSON object"),
+    ('{"match":true,"query_number":1}', "Missing required keys"),
+    ('{"match":"yes","query_number":1,"similarity":90,"modification_needed":false,"modifications":""}', "'match' must be a boolean"),
+    ('{"match":true,"query_number":null,"similarity":90,"modification_needed":false,"modifications":""}', "'query_number' must be a number"),
+    ('{"match":true,"query_number":1.7,"similarity":90,"modification_needed":false,"modifications":""}', "'query_number' must be an integer"),
+    ('{"match":true,"query_number":true,"similarity":90,"modification_needed":false,"modifications":""}', "'query_number' must be a number"),
+    ('{"match":true,"query_number":1,"similarity":"high","modification_needed":false,"modifications":""}', "'similarity' must be a number"),
+    ('{"match":true,"query_number":1,"similarity":120,"modification_needed":false,"modifications":""}', "between 0 and 100"),
+    ('{"match":true,"query_number":1,"similarity":-1,"modification_needed":false,"modifications":""}', "between 0 and 100"),
+])
+def test_invalid_responses(response, message):
+    with pytest.raises(ValueError, match=message):
+        parse_match_response(response)
+
+@pytest.mark.parametrize("query_number", [0, 4])
+def test_out_of_range_query_number(query_number):
+    response = f'{{"match":true,"query_number":{query_number},"similarity":90,"modification_needed":false,"modifications":""}}'
+    with pytest.raises(ValueError, match="between 1 and 3"):
+        parse_match_response(response, query_count=3)
+    assert parse_match_response(response)["query_number"] == query_number
+
+def test_no_match_ignores_query_count():
+    assert parse_match_response('{"match":false,"query_number":0}', query_count=3)["match"] is False
\ No newline at end of file
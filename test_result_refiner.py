@@ -0,0 +1,107 @@
+import json
+
+import pandas as pd
+import pytest
+
+from result_refiner import looks_like_refinement, parse_refinement_plan, apply_refinement
+
+# AI SDK results hold every value as text
+ORDERS = pd.DataFrame({
+    "state": ["SP", "RJ", "SP", "MG"],
+    "amount": ["10", "20", "30", "5"],
+    "purchase_time": ["2018-01-05", "2018-02-10", "2018-02-20", "2018-03-01"]
+})
+
+def plan(**steps):
+    response = {"local": True, "filters": [], "group_by": [], "aggregations": [], "sort": [], "limit": None}
+    response.update(steps)
+    return parse_refinement_plan(json.dumps(response), ORDERS)
+
+def test_parse_extracts_json_from_surrounding_text():
+    parsed = parse_refinement_plan('Plan: {"local": true, "limit": "2"} done', ORDERS)
+    assert parsed["local"] is True
+    assert parsed["limit"] == 2
+    assert parsed["filters"] == []
+
+def test_parse_non_local_plan_skips_column_checks():
+    parsed = parse_refinement_plan('{"local": false, "filters": [{"column": "customer", "op": "=", "value": 1}]}', ORDERS)
+    assert parsed["local"] is False
+
+@pytest.mark.parametrize("response, message", [
+    ("no plan here", "No JSON object"),
+    ('{"local": true, "filters": [{"column": "customer", "op": "=", "value": "x"}]}', "Columns not in previous result"),
+    ('{"local": true, "filters": [{"column": "amount", "op": "like", "value": "x"}]}', "Unsupported filter operator"),
+    ('{"local": true, "aggregations": [{"column": "amount", "func": "median"}]}', "Unsupported aggregation"),
+    ('{"local": true, "sort": [{"column": "total", "ascending": false}]}', "Columns not in previous result"),
+    ('{"local": true, "limit": 0}', "Invalid limit"),
+])
+def test_parse_rejects_invalid_plans(response, message):
+    with pytest.raises(ValueError, match=message):
+        parse_refinement_plan(response, ORDERS)
+
+def test_sort_may_use_aggregation_alias():
+    parsed = plan(aggregations=[{"column": "amount", "func": "sum"}], sort=[{"column": "sum_amount"}])
+    assert parsed["sort"] == [{"column": "sum_amount"}]
+
+@pytest.mark.parametrize("value", ["9", 9, 9.0])
+def test_numeric_filter_on_text_column(value):
+    result = apply_refinement(ORDERS, plan(filters=[{"column": "amount", "op": ">", "value": value}]))
+    assert result["amount"].tolist() == ["10", "20", "30"]
+
+def test_numeric_filter_then_sum():
+    result = apply_refinement(ORDERS, plan(
+        filters=[{"column": "amount", "op": ">", "value": "9"}],
+        aggregations=[{"column": "amount", "func": "sum", "alias": "total"}]
+    ))
+    assert result["total"].tolist() == [60]
+
+def test_numeric_equality_ignores_formatting():
+    result = apply_refinement(ORDERS, plan(filters=[{"column": "amount", "op": "=", "value": "20.0"}]))
+    assert result["state"].tolist() == ["RJ"]
+
+def test_in_filter_on_numbers_and_text():
+    numbers = apply_refinement(ORDERS, plan(filters=[{"column": "amount", "op": "in", "value": [5, "30"]}]))
+    assert numbers["amount"].tolist() == ["30", "5"]
+    text = apply_refinement(ORDERS, plan(filters=[{"column": "state", "op": "in", "value": ["SP"]}]))
+    assert len(text) == 2
+
+def test_text_filter_on_text_column():
+    result = apply_refinement(ORDERS, plan(filters=[{"column": "state", "op": "!=", "value": "SP"}]))
+    assert result["state"].tolist() == ["RJ", "MG"]
+
+def test_group_by_month_sorted_top_n():
+    result = apply_refinement(ORDERS, plan(
+        group_by=[{"column": "purchase_time", "grain": "month"}],
+        aggregations=[{"column": "amount", "func": "sum", "alias": "total"}],
+        sort=[{"column": "total", "ascending": False}],
+        limit=2
+    ))
+    assert result.to_dict("records") == [
+        {"purchase_time": "2018-02", "total": 50},
+        {"purchase_time": "2018-01", "total": 10}
+    ]
+
+def test_sort_numbers_stored_as_text():
+    result = apply_refinement(ORDERS, plan(sort=[{"column": "amount", "ascending": True}], limit=2))
+    assert result["amount"].tolist() == ["5", "10"]
+
+@pytest.mark.parametrize("question", [
+    "only the ones from SP",
+    "top 5 by amount",
+    "now break it down by month",
+    "sort them by amount",
+    "show those over 100",
+    "what about canceled instead?",
+    "how much of that came from RJ?"
+])
+def test_follow_ups_look_like_refinements(question):
+    assert looks_like_refinement(question)
+
+@pytest.mark.parametrize("question", [
+    "Which customers spent the most last year?",
+    "total revenue per state in 2018",
+    "How many orders were shipped in 2017?",
+    "average delivery time by month"
+])
+def test_new_questions_do_not_look_like_refinements(question):
+    assert not looks_like_refinement(question)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import pytest
+
+from revalidation import bind_sample_parameters, find_regressions, last_successful, update_performance, SLOWDOWN_FACTOR, MIN_SLOWDOWN_MS
+
+def record(status="ok", runtime_ms=1000, checksum="abc", validated_at="01 March 2025 10:00:00"):
+    return {
+        "validated_at": validated_at,
+        "status": status,
+        "error": None if status == "ok" else "Connection refused",
+        "runtime_ms": runtime_ms,
+        "row_count": 1 if status == "ok" else None,
+        "result_checksum": checksum if status == "ok" else None
+    }
+
+def test_failure_keeps_and_success_replaces_last_ok():
+    first = update_performance(None, record(runtime_ms=1000))
+    assert "last_ok" not in first
+
+    failed = update_performance(first, record(status="error", validated_at="02 March 2025 10:00:00"))
+    assert failed["status"] == "error"
+    assert failed["last_ok"] == first
+    assert last_successful(failed) == first
+
+    recovered = update_performance(failed, record(runtime_ms=900, validated_at="03 March 2025 10:00:00"))
+    assert "last_ok" not in recovered
+    assert last_successful(recovered)["runtime_ms"] == 900
+
+def test_failing_persists_across_repeated_failures():
+    stored = update_performance(None, record())
+    for day in ("02", "03", "04"):
+        current = record(status="error", validated_at=f"{day} March 2025 10:00:00")
+        assert find_regressions(stored, current) == ["failing"]
+        stored = update_performance(stored, current)
+    assert stored["last_ok"]["validated_at"] == "01 March 2025 10:00:00"
+
+def test_first_failure_without_baseline_is_not_a_regression():
+    assert find_regressions(None, record(status="error")) == []
+    assert find_regressions(record(status="error"), record(status="error")) == []
+
+@pytest.mark.parametrize("baseline_ms, runtime_ms, slower", [
+    (1000, round(1000 * SLOWDOWN_FACTOR) + 1, True),
+    (1000, round(1000 * SLOWDOWN_FACTOR), False),
+    # A large relative slowdown of a fast query stays below MIN_SLOWDOWN_MS
+    (100, 100 + MIN_SLOWDOWN_MS - 1, False),
+    (100, 100 + MIN_SLOWDOWN_MS, True)
+])
+def test_slower_needs_both_factor_and_minimum(baseline_ms, runtime_ms, slower):
+    regressions = find_regressions(record(runtime_ms=baseline_ms), record(runtime_ms=runtime_ms))
+    assert ("slower" in regressions) == slower
+
+def test_slower_is_measured_against_last_ok():
+    stored = update_performance(record(runtime_ms=1000), record(status="error", runtime_ms=120000))
+    assert find_regressions(stored, record(runtime_ms=1100)) == []
+
+def test_changed_checksum_is_flagged():
+    assert find_regressions(record(checksum="abc"), record(checksum="def")) == ["changed results"]
+    assert find_regressions(record(checksum="abc"), record(checksum="abc")) == []
+
+def test_bind_sample_parameters():
+    sql = 'SELECT * FROM "orders" WHERE "order_status" = \'{status}\' AND "year" = {year} AND "state" = {state}'
+    bound = bind_sample_parameters(sql, {"status": "delivered", "year": 2018})
+    assert bound == 'SELECT * FROM "orders" WHERE "order_status" = \'delivered\' AND "year" = 2018 AND "state" = {state}'
+    assert bind_sample_parameters(sql, {}) == sql
\ No newline at end of file
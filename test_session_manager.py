@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import pytest
+
+import session_manager
+from session_manager import get_session, cache_partition
+
+# Each test gets an empty session pool, closed again afterwards
+@pytest.fixture(autouse=True)
+def sessions(monkeypatch):
+    pool = {}
+    monkeypatch.setattr(session_manager, "_sessions", pool)
+    yield pool
+    for entry in pool.values():
+        entry["session"].close()
+
+def respond(session, status_code):
+    for hook in session.hooks["response"]:
+        hook(SimpleNamespace(status_code=status_code))
+
+def test_partition_requires_accepted_credentials(monkeypatch):
+    monkeypatch.setattr(session_manager, "USER_ROLES", {"bob": "sales"})
+    assert cache_partition("alice", "secret") is None
+
+    respond(get_session("alice", "wrong"), 401)
+    assert cache_partition("alice", "wrong") is None
+
+    respond(get_session("alice", "secret"), 200)
+    assert cache_partition("alice", "secret") == "user-alice"
+    assert cache_partition("alice", "guess") is None
+
+    respond(get_session("bob", "secret"), 200)
+    assert cache_partition("bob", "secret") == "role-sales"
+
+def test_rejected_credentials_lose_their_partition(sessions):
+    session = get_session("carol", "secret")
+    respond(session, 200)
+    respond(session, 401)
+    assert cache_partition("carol", "secret") is None
+    assert len(sessions) == 1
\ No newline at end of file
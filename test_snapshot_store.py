@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import snapshot_store
+from snapshot_store import save_snapshot, load_snapshot
+
+SQL = 'SELECT "state", COUNT(*) FROM "ECommerce"."orders" GROUP BY "state"'
+ORDERS = pd.DataFrame({"state": ["SP", "RJ"], "orders": [3, 1]})
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_store, "SNAPSHOT_DIR", str(tmp_path))
+    return tmp_path
+
+def test_round_trip_returns_arrow_table():
+    saved = save_snapshot("Orders by state", SQL, ORDERS, "user-alice")
+    snapshot = load_snapshot("Orders by state", SQL, "user-alice")
+    assert snapshot["row_count"] == 2
+    assert snapshot["sql_hash"] == saved["sql_hash"]
+    assert snapshot["table"].to_pandas().equals(ORDERS)
+
+def test_same_name_with_different_sql_keeps_both():
+    other_sql = SQL.replace("COUNT(*)", "COUNT(DISTINCT \"customer\")")
+    save_snapshot("Orders by state", SQL, ORDERS, "user-alice")
+    save_snapshot("Orders by state", other_sql, ORDERS.head(1), "user-alice")
+    assert load_snapshot("Orders by state", SQL, "user-alice")["row_count"] == 2
+    assert load_snapshot("Orders by state", other_sql, "user-alice")["row_count"] == 1
+
+def test_sql_hash_mismatch_returns_none():
+    saved = save_snapshot("Orders by state", SQL, ORDERS, "user-alice")
+    other_sql = SQL + " ORDER BY 2"
+    # A snapshot written for other SQL under this path must not be served
+    os.replace(saved["path"], snapshot_store.snapshot_path("Orders by state", other_sql, "user-alice"))
+    assert load_snapshot("Orders by state", other_sql, "user-alice") is None
+
+def test_partitions_are_separate():
+    save_snapshot("Orders by state", SQL, ORDERS, "user-alice")
+    assert load_snapshot("Orders by state", SQL, "user-bob") is None
+    assert load_snapshot("Orders by state", SQL, "role-sales") is None
+
+def test_mixed_type_columns_are_stored_as_text():
+    mixed = pd.DataFrame({"value": [1, "n/a"], "orders": [3, 1]})
+    save_snapshot("Mixed", SQL, mixed, "user-alice")
+    table = load_snapshot("Mixed", SQL, "user-alice")["table"]
+    assert table.column("value").to_pylist() == ["1", "n/a"]
+    assert table.column("orders").to_pylist() == ["3", "1"]
\ No newline at end of file
@@ -0,0 +1,32 @@
+import pytest
+
+from vql_client import with_query_timeout, strip_comments_and_literals
+
+TIMEOUT = "\nCONTEXT('querytimeout' = '1000')"
+
+@pytest.mark.parametrize("vql, expected", [
+    ("SELECT 1", "SELECT 1"),
+    ("SELECT 1;", "SELECT 1"),
+    ("SELECT 1; -- note", "SELECT 1"),
+    ("SELECT 1 /* done */;\n-- a\n-- b\n", "SELECT 1"),
+    ("SELECT 'a;--b' FROM t -- note", "SELECT 'a;--b' FROM t"),
+    ("SELECT 1 -- options: a, b\nFROM t;", "SELECT 1 -- options: a, b\nFROM t"),
+])
+def test_timeout_is_appended_after_the_statement(vql, expected):
+    assert with_query_timeout(vql, 1) == expected + TIMEOUT
+
+def test_existing_context_is_kept():
+    vql = "SELECT 1 CONTEXT('querytimeout' = '5')"
+    assert with_query_timeout(vql, 1) == vql
+
+@pytest.mark.parametrize("vql", [
+    "SELECT 'CONTEXT(' FROM t",
+    "SELECT 1 FROM t -- CONTEXT(x)",
+    "SELECT 1 FROM t /* CONTEXT( */",
+])
+def test_context_in_comments_and_literals_is_ignored(vql):
+    assert with_query_timeout(vql, 1).endswith(TIMEOUT)
+
+def test_strip_comments_and_literals():
+    sql = "SELECT 'it''s -- x' -- don't\nFROM \"a--b\" /* c */"
+    assert strip_comments_and_literals(sql) == "SELECT ''  \nFROM \"a--b\"  "
\ No newline at end of file
@@ -0,0 +1,80 @@
+import re
+from typing import Dict, Any, Tuple, Optional, TYPE_CHECKING
+
+# requests is imported when a query is executed, not when the apps start
+if TYPE_CHECKING:
+    import requests
+
+# Configuration
+DENODO_CATALOG_ENDPOINT = "http://localhost:39090/denodo-data-catalog/public/api/askaquestion/execute"
+SERVER_ID = 1
+VERIFY_SSL = False
+RESULT_ROW_LIMIT = 1000
+# Deadline for a single query; also passed to VDP so the server stops the query too
+QUERY_TIMEOUT_SECONDS = 120
+SERVER_QUERY_TIMEOUT = True
+
+CONTEXT_PATTERN = re.compile(r'\bCONTEXT\s*\(', re.IGNORECASE)
+# String literals, quoted identifiers, comments, whitespace and runs of other characters
+SQL_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\s+|[^'\"\s/-]+|.", re.DOTALL)
+
+def _is_comment(token: str) -> bool:
+    return token.startswith('--') or token.startswith('/*')
+
+# Remove comments and empty string literals so keywords inside them are ignored
+def strip_comments_and_literals(sql: str) -> str:
+    tokens = SQL_TOKEN_PATTERN.findall(sql)
+    return "".join("''" if token.startswith("'") else " " if _is_comment(token) else token for token in tokens)
+
+def strip_statement_end(sql: str) -> str:
+    """Remove trailing comments, whitespace and semicolons so a clause can be appended."""
+    end = 0
+    for match in SQL_TOKEN_PATTERN.finditer(sql):
+        token = match.group(0)
+        if not (token.isspace() or _is_comment(token) or token == ';'):
+            end = match.end()
+    statement = sql[:end].rstrip()
+    while statement.endswith(';'):
+        statement = statement[:-1].rstrip()
+    return statement
+
+def with_query_timeout(vql: str, seconds: float = QUERY_TIMEOUT_SECONDS) -> str:
+    """Add a VDP CONTEXT('querytimeout') clause unless the query already sets a context."""
+    if not SERVER_QUERY_TIMEOUT or CONTEXT_PATTERN.search(strip_comments_and_literals(vql)):
+        return vql
+    return f"{strip_statement_end(vql)}\nCONTEXT('querytimeout' = '{int(seconds * 1000)}')"
+
+def post_vql(vql: str, auth: Tuple[str, str], limit: int = RESULT_ROW_LIMIT,
+             session: Optional["requests.Session"] = None, timeout: float = QUERY_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    Execute VQL against the Data Catalog and return its rows and column names.
+    Does not touch Streamlit, so it is safe to call from worker threads.
+    Raises requests.RequestException on connection or HTTP errors.
+    """
+    import requests
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    }
+
+    data = {
+        "vql": vql,
+        "limit": limit
+    }
+
+    response = (session or requests).post(
+        f"{DENODO_CATALOG_ENDPOINT}?serverId={SERVER_ID}",
+        json=data,
+        headers=headers,
+        auth=auth,
+        verify=VERIFY_SSL,
+        timeout=timeout
+    )
+    response.raise_for_status()
+
+    json_response = response.json()
+    return {
+        "rows": json_response.get('rows', []),
+        "columnNames": json_response.get('columnNames', [])
+    }
\ No newline at end of file